@@ -0,0 +1,170 @@
+# Sales reports per day, per product and per category (see /admin/reports in main.py).
+# Adding up every order item for each report gets slower with every order placed, so the items are added up ahead of
+# time into rollup tables instead (see ProductDailySales and CategoryDailySales in models.py): one row per product per
+# day, and one row per category per day. A report only reads the rollup rows of the days it covers.
+#
+# update_rollups() adds the orders placed since it last ran. How far it has got is kept as a high-water mark on order
+# id (see RollupState), so each run only reads the new orders. Run it from the repository root, either once or every
+# few seconds (ie: as a scheduled job or a separate worker process):
+# python analytics.py
+# python analytics.py --every 60
+# Running it more than once at the same time is safe: each run moves the mark forward with a conditional UPDATE in the
+# same transaction as its rollup rows, so only one run can add up any given order.
+import argparse
+from datetime import date, datetime, timedelta
+import time
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, Product, Order, OrderItem, ProductDailySales, CategoryDailySales, RollupState
+
+ROLLUP_NAME = "orders"
+# Most orders added up per transaction. The rest are added up by the next batch.
+ROLLUP_BATCH_SIZE = 5000
+# Orders are only added up once they are this many seconds old. An order gets its id before it is committed, so a newer
+# order can be committed before an older one. Waiting lets the older one commit first, so the mark doesn't pass it.
+ROLLUP_SETTLE_SECONDS = 10
+REPORT_GROUPS = ["day", "product", "category"]
+CSV_COLUMNS = ["day", "product_id", "product", "category", "units", "revenue"]
+
+
+def rolled_up_to():
+    state = RollupState.query.get(ROLLUP_NAME)
+    return state.last_order_id if state else 0
+
+
+# Moves the mark from last_order_id to new_order_id. Returns False if another run moved it first.
+def _move_mark(last_order_id, new_order_id):
+    if last_order_id == 0 and RollupState.query.get(ROLLUP_NAME) is None:
+        db.session.add(RollupState(name=ROLLUP_NAME, last_order_id=new_order_id))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            return False
+        return True
+    result = db.session.execute(RollupState.__table__.update().where(
+        (RollupState.name == ROLLUP_NAME) & (RollupState.last_order_id == last_order_id)
+    ).values(last_order_id=new_order_id))
+    return result.rowcount == 1
+
+
+# Adds the rows of a SELECT to a rollup table, adding their units and revenue to the rows that already exist for the
+# same key. Runs as a single INSERT ... SELECT ... ON CONFLICT statement, so the rows never leave the database.
+def _add_to_rollup(model, key_columns, rows):
+    insert = postgresql.insert if db.engine.dialect.name == "postgresql" else sqlite.insert
+    table = model.__table__
+    statement = insert(table).from_select(key_columns + ["units", "revenue_cents"], rows)
+    statement = statement.on_conflict_do_update(index_elements=key_columns, set_=dict(
+        units=table.c.units + statement.excluded.units,
+        revenue_cents=table.c.revenue_cents + statement.excluded.revenue_cents,
+    ))
+    db.session.execute(statement)
+
+
+# Adds up the next batch of orders into the rollup tables and returns how many orders it added up (0 when there were
+# no new orders, or another run got to them first).
+def update_rollups(batch_size=ROLLUP_BATCH_SIZE, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    settled_before = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    last_order_id = rolled_up_to()
+    # The batch stops at the first order that hasn't settled yet, even if later ones have.
+    order_ids = []
+    for order_id, created_at in db.session.query(Order.id, Order.created_at).filter(Order.id > last_order_id) \
+            .order_by(Order.id).limit(batch_size):
+        if created_at >= settled_before:
+            break
+        order_ids.append(order_id)
+    if not order_ids:
+        db.session.rollback()
+        return 0
+
+    if not _move_mark(last_order_id, order_ids[-1]):
+        db.session.rollback()
+        return 0
+    day = db.func.date(Order.created_at, type_=db.Date)
+    units = db.func.sum(OrderItem.quantity)
+    revenue_cents = db.func.sum(OrderItem.quantity * OrderItem.unit_price_cents)
+    new_items = db.select(OrderItem.__table__).join(Order, OrderItem.order_id == Order.id) \
+        .where(OrderItem.order_id > last_order_id, OrderItem.order_id <= order_ids[-1])
+    _add_to_rollup(ProductDailySales, ["day", "product_id"], new_items.with_only_columns(
+        day, OrderItem.product_id, units, revenue_cents).group_by(day, OrderItem.product_id))
+    _add_to_rollup(CategoryDailySales, ["day", "category"], new_items.join(
+        Product, OrderItem.product_id == Product.id).with_only_columns(
+        day, Product.category, units, revenue_cents).group_by(day, Product.category))
+    db.session.commit()
+    return len(order_ids)
+
+
+# Adds up every order that has settled, one batch at a time. Returns how many orders it added up.
+def run_rollups(batch_size=ROLLUP_BATCH_SIZE, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    total = 0
+    while True:
+        added = update_rollups(batch_size, settle_seconds)
+        total += added
+        if added < batch_size:
+            return total
+
+
+# --- Reports --- #
+# Units sold and revenue between start and end (both included), grouped by day, product or category, ie:
+# [{"day": "2026-10-18", "units": 12, "revenue": 31.5}, ...]
+# [{"product_id": 9, "product": "hat", "category": "clothes", "units": 3, "revenue": 15.0}, ...]
+def sales_report(start, end, group="day"):
+    if group == "product":
+        # The product rows are added up first, and only then matched with their products.
+        totals = db.session.query(ProductDailySales.product_id, db.func.sum(ProductDailySales.units).label("units"),
+                                  db.func.sum(ProductDailySales.revenue_cents).label("revenue_cents")) \
+            .filter(ProductDailySales.day.between(start, end)).group_by(ProductDailySales.product_id).subquery()
+        rows = db.session.query(Product.id, Product.name, Product.category, totals.c.units, totals.c.revenue_cents) \
+            .join(totals, totals.c.product_id == Product.id).order_by(totals.c.revenue_cents.desc(), Product.name)
+        return [dict(product_id=product_id, product=name, category=category, units=row_units,
+                     revenue=row_revenue_cents / 100)
+                for product_id, name, category, row_units, row_revenue_cents in rows]
+    # Days and categories are read from the category rollup, which has fewer rows per day.
+    key = CategoryDailySales.category if group == "category" else CategoryDailySales.day
+    units = db.func.sum(CategoryDailySales.units)
+    revenue_cents = db.func.sum(CategoryDailySales.revenue_cents)
+    rows = db.session.query(key, units, revenue_cents).filter(CategoryDailySales.day.between(start, end)) \
+        .group_by(key)
+    rows = rows.order_by(revenue_cents.desc(), key) if group == "category" else rows.order_by(key)
+    return [{group: row_key.isoformat() if isinstance(row_key, date) else row_key, "units": row_units,
+             "revenue": row_revenue_cents / 100} for row_key, row_units, row_revenue_cents in rows]
+
+
+# Every product's units and revenue per day between start and end, as CSV_COLUMNS rows, read in chunks so a large
+# date range is never held in memory all at once.
+def sales_rows(start, end, chunk_size=1000):
+    rows = db.session.query(ProductDailySales.day, Product.id, Product.name, Product.category,
+                            ProductDailySales.units, ProductDailySales.revenue_cents) \
+        .join(Product, ProductDailySales.product_id == Product.id) \
+        .filter(ProductDailySales.day.between(start, end)) \
+        .order_by(ProductDailySales.day, Product.id).yield_per(chunk_size)
+    for day, product_id, name, category, units, revenue_cents in rows:
+        yield [day.isoformat(), product_id, name, category, units, f"{revenue_cents / 100:.2f}"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--every", type=float, help="keep running, adding up new orders every this many seconds")
+    parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+    return parser.parse_args()
+
+
+def main():
+    from main import create_app
+
+    arguments = parse_arguments()
+    # Only the database is needed, so the app's caches aren't warmed.
+    app = create_app(WARM_CACHES=False)
+    with app.app_context():
+        while True:
+            start = time.perf_counter()
+            added = run_rollups(arguments.batch_size)
+            print(f"Added up {added} orders in {(time.perf_counter() - start) * 1000:.0f}ms, "
+                  f"rolled up to order #{rolled_up_to()}", flush=True)
+            db.session.remove()
+            if not arguments.every:
+                break
+            time.sleep(arguments.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Micro-benchmark for convert_shopping_cart. Builds a throwaway SQLite database with a synthetic catalog, then times
+# how long it takes to turn carts of increasing size into a CartSummary and counts the SQL queries it issued.
+# Run from the repository root:
+# python benchmarks/cart_aggregation.py
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+database_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL1"] = f"sqlite:///{database_path}"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from sqlalchemy import event  # noqa: E402
+from main import create_app, db, Product, convert_shopping_cart  # noqa: E402
+
+# The database is empty until it is seeded, so there is nothing to warm.
+app = create_app(WARM_CACHES=False)
+
+CART_SIZES = [1, 10, 100, 1000, 5000]
+REPEATS = 5
+
+
+def seed_products(count):
+    db.create_all()
+    db.session.bulk_insert_mappings(Product, [
+        dict(name=f"product {number}", category="bench", category_title="Bench", description="Benchmark product.",
+             price=1.25, img="apple.jpg")
+        for number in range(count)
+    ])
+    db.session.commit()
+
+
+def main():
+    with app.app_context():
+        seed_products(max(CART_SIZES))
+        product_ids = [product_id for product_id, in db.session.query(Product.id)]
+        queries = []
+        event.listen(db.engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+        print(f"{'distinct items':>15} {'units':>8} {'best ms':>10} {'queries':>8}")
+        for size in CART_SIZES:
+            shopping_cart = {product_id: 3 for product_id in product_ids[:size]}
+            timings = []
+            for _ in range(REPEATS):
+                queries.clear()
+                db.session.expunge_all()
+                start = time.perf_counter()
+                convert_shopping_cart(shopping_cart)
+                timings.append(time.perf_counter() - start)
+            print(f"{size:>15} {sum(shopping_cart.values()):>8} {min(timings) * 1000:>10.2f} {len(queries):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Concurrency test for checkout (see checkout.py). Builds a throwaway SQLite database with a few products that only have
+# a little stock each, then places many orders from several threads at once. Every order is sent twice with the same
+# idempotency key, like a double-clicked button. Afterwards it checks that:
+#   - no product sold more units than it had in stock, and no stock went below 0,
+#   - the units in the orders add up to the stock that was taken,
+#   - no idempotency key placed more than one order,
+#   - both sends of a key got the same result: the same order, or both out of stock,
+# and reports the checkouts per second and p50/p95/p99 latency.
+# Exits with status 1 if any check fails. Run from the repository root:
+# python benchmarks/checkout_concurrency.py
+# python benchmarks/checkout_concurrency.py --checkouts 2000 --threads 32 --stock 50
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+database_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL1"] = f"sqlite:///{database_path}"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from sqlalchemy import func  # noqa: E402
+from main import create_app  # noqa: E402
+from checkout import place_order, OutOfStock  # noqa: E402
+from models import db, User, Product, Order, OrderItem  # noqa: E402
+
+# The database is empty until it is seeded, so there is nothing to warm.
+app = create_app(WARM_CACHES=False)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--stock", type=int, default=20, help="starting stock of each product")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--checkouts", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    return parser.parse_args()
+
+
+def seed_database(arguments):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Product.__table__.insert(), [
+            dict(name=f"product {number}", category="limited", category_title="Limited",
+                 description="Limited stock.", price=1.25, img="apple.jpg", stock=arguments.stock)
+            for number in range(arguments.products)
+        ])
+        db.session.execute(User.__table__.insert(), [
+            dict(name=f"user {number}", email=f"user{number}@example.com", password="-")
+            for number in range(arguments.users)
+        ])
+        db.session.commit()
+        return [product_id for product_id, in db.session.query(Product.id)]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def main():
+    arguments = parse_arguments()
+    product_ids = seed_database(arguments)
+    random.seed(0)
+    # Each checkout is (user id, {product id: quantity}, idempotency key), and is sent twice.
+    checkouts = [(random.randint(1, arguments.users),
+                  {product_id: random.randint(1, 3) for product_id in random.sample(product_ids, random.randint(1, 3))},
+                  uuid.uuid4().hex) for _ in range(arguments.checkouts)]
+    requests = [checkout for checkout in checkouts for _ in range(2)]
+
+    latencies = []
+    outcomes = {"placed": 0, "already_placed": 0, "out_of_stock": 0, "errors": 0}
+    # {idempotency key: [the order id each send got, or "out of stock"]}
+    key_results = {}
+    lock = threading.Lock()
+
+    def one_checkout(checkout):
+        user_id, quantities, idempotency_key = checkout
+        start = time.perf_counter()
+        with app.app_context():
+            try:
+                order, placed = place_order(user_id, quantities, idempotency_key)
+                outcome = "placed" if placed else "already_placed"
+                result = order.id
+            except OutOfStock:
+                outcome = "out_of_stock"
+                result = "out of stock"
+            except Exception as error:
+                print(f"Checkout failed: {error!r}", file=sys.stderr)
+                outcome = "errors"
+                result = "error"
+            finally:
+                db.session.remove()
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            outcomes[outcome] += 1
+            key_results.setdefault(idempotency_key, []).append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=arguments.threads) as pool:
+        list(pool.map(one_checkout, requests))
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        stock = dict(db.session.query(Product.id, Product.stock))
+        sold = dict(db.session.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+                    .group_by(OrderItem.product_id))
+        orders = db.session.query(func.count(Order.id)).scalar()
+        keys = db.session.query(func.count(func.distinct(Order.idempotency_key))).scalar()
+
+    failures = []
+    for product_id in product_ids:
+        if stock[product_id] < 0:
+            failures.append(f"product {product_id} has {stock[product_id]} stock")
+        if sold.get(product_id, 0) + stock[product_id] != arguments.stock:
+            failures.append(f"product {product_id} sold {sold.get(product_id, 0)} units but has {stock[product_id]} "
+                            f"of {arguments.stock} left")
+    if keys != orders or outcomes["placed"] != orders:
+        failures.append(f"{orders} orders were placed with {keys} idempotency keys, {outcomes['placed']} checkouts "
+                        f"reported placing an order")
+    mismatched_keys = [results for results in key_results.values() if results[0] != results[1]]
+    if mismatched_keys:
+        failures.append(f"{len(mismatched_keys)} keys got different results from their two sends, ie: "
+                        f"{mismatched_keys[0]}")
+    if outcomes["errors"]:
+        failures.append(f"{outcomes['errors']} checkouts failed with an error")
+
+    latencies.sort()
+    print(f"{len(requests)} checkouts ({arguments.checkouts} keys, each sent twice) from {arguments.threads} threads "
+          f"in {elapsed:.2f}s: {len(requests) / elapsed:.0f} checkouts/s, "
+          f"p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f}ms, p99 {percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"{orders} orders placed, {outcomes['already_placed']} checkouts returned an order already placed, "
+          f"{outcomes['out_of_stock']} checkouts out of stock, "
+          f"{sum(sold.values())} of {arguments.stock * len(product_ids)} units sold")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
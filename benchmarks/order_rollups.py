@@ -0,0 +1,143 @@
+# Benchmark for the sales rollups (see analytics.py). Builds a throwaway SQLite database with a year of synthetic
+# orders, then:
+#   - times adding up every order into the rollup tables, then adding up a smaller batch of new orders from several
+#     threads at once (as overlapping scheduled runs would),
+#   - checks that the rollups match the units and revenue summed straight from order_items,
+#   - times each report from the rollups against the same report summed straight from order_items,
+#   - times the full-year CSV export.
+# Exits with status 1 if the rollups don't match. Run from the repository root:
+# python benchmarks/order_rollups.py
+# python benchmarks/order_rollups.py --orders 1000000
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+database_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL1"] = f"sqlite:///{database_path}"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from main import create_app  # noqa: E402
+from analytics import run_rollups, sales_report, sales_rows, REPORT_GROUPS  # noqa: E402
+from models import db, User, Product, Order, OrderItem, CategoryDailySales  # noqa: E402
+
+# The database is empty until it is seeded, so there is nothing to warm.
+app = create_app(WARM_CACHES=False)
+CATEGORIES = 25
+DAYS = 365
+YEAR_START = date(2025, 1, 1)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--new-orders", type=int, default=5000, help="orders added after the first rollup")
+    parser.add_argument("--threads", type=int, default=4, help="rollup runs at once for the new orders")
+    return parser.parse_args()
+
+
+def add_orders(count, first_order_id, products):
+    orders = []
+    items = []
+    for order_id in range(first_order_id, first_order_id + count):
+        created_at = datetime.combine(YEAR_START, datetime.min.time()) + \
+            timedelta(seconds=random.randrange(DAYS * 86400))
+        lines = [(random.randint(1, products), random.randint(1, 5), random.randint(25, 5000))
+                 for _ in range(random.randint(1, 4))]
+        orders.append(dict(id=order_id, user_id=1, created_at=created_at,
+                           total_price_cents=sum(quantity * price for _, quantity, price in lines)))
+        items += [dict(order_id=order_id, product_id=product_id, quantity=quantity, unit_price_cents=price)
+                  for product_id, quantity, price in lines]
+    db.session.execute(Order.__table__.insert(), orders)
+    db.session.execute(OrderItem.__table__.insert(), items)
+    db.session.commit()
+
+
+def seed_database(arguments):
+    db.create_all()
+    db.session.execute(Product.__table__.insert(), [
+        dict(name=f"product {number}", category=f"category_{number % CATEGORIES}",
+             category_title=f"Category {number % CATEGORIES}", description="Synthetic product.", price=1.0,
+             img="apple.jpg") for number in range(arguments.products)
+    ])
+    db.session.execute(User.__table__.insert(), [dict(name="user", email="user@example.com", password="-")])
+    db.session.commit()
+    add_orders(arguments.orders, 1, arguments.products)
+
+
+# The same reports as sales_report, summed straight from every order item.
+def raw_report(start, end, group):
+    day = db.func.date(Order.created_at)
+    key = {"day": day, "product": OrderItem.product_id, "category": Product.category}[group]
+    return db.session.query(key, db.func.sum(OrderItem.quantity),
+                            db.func.sum(OrderItem.quantity * OrderItem.unit_price_cents)) \
+        .join(Order, OrderItem.order_id == Order.id).join(Product, OrderItem.product_id == Product.id) \
+        .filter(day.between(start.isoformat(), end.isoformat())).group_by(key).all()
+
+
+def timed(function, *arguments):
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    arguments = parse_arguments()
+    random.seed(0)
+    with app.app_context():
+        _, seed_ms = timed(seed_database, arguments)
+        print(f"Seeded {arguments.orders} orders in {seed_ms / 1000:.1f}s")
+
+        added, rollup_ms = timed(run_rollups)
+        print(f"First rollup: {added} orders in {rollup_ms:.0f}ms")
+        add_orders(arguments.new_orders, arguments.orders + 1, arguments.products)
+
+    added_counts = []
+
+    def rollup_thread():
+        with app.app_context():
+            added_counts.append(run_rollups(batch_size=500))
+            db.session.remove()
+
+    threads = [threading.Thread(target=rollup_thread) for _ in range(arguments.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Incremental rollup: {sum(added_counts)} new orders from {arguments.threads} threads at once in "
+          f"{(time.perf_counter() - start) * 1000:.0f}ms")
+
+    failures = []
+    if sum(added_counts) != arguments.new_orders:
+        failures.append(f"{sum(added_counts)} new orders were added up, expected {arguments.new_orders}")
+    start_day, end_day = YEAR_START, YEAR_START + timedelta(days=DAYS - 1)
+    with app.app_context():
+        for group in REPORT_GROUPS:
+            report, report_ms = timed(sales_report, start_day, end_day, group)
+            raw, raw_ms = timed(raw_report, start_day, end_day, group)
+            print(f"Report by {group:>8}: {report_ms:7.1f}ms from the rollups, {raw_ms:7.1f}ms from order_items "
+                  f"({len(report)} rows)")
+            totals = sorted((row["units"], round(row["revenue"] * 100)) for row in report)
+            raw_totals = sorted((units, revenue_cents) for _, units, revenue_cents in raw)
+            if totals != raw_totals:
+                failures.append(f"the report by {group} doesn't match order_items")
+
+        rows, csv_ms = timed(lambda: sum(1 for _ in sales_rows(start_day, end_day)))
+        print(f"CSV export: {rows} rows in {csv_ms:.0f}ms")
+        category_days = db.session.query(db.func.count()).select_from(CategoryDailySales).scalar()
+        print(f"Rollup rows: {category_days} category days")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
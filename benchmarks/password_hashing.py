@@ -0,0 +1,41 @@
+# Benchmark for password checking at different hashing costs. For each PBKDF2 iteration count it reports how many
+# logins per second a single core can check, and how many the PasswordHasher pool checks per second with all its
+# threads busy.
+# Run from the repository root:
+# python benchmarks/password_hashing.py
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash, check_password_hash  # noqa: E402
+from passwords import PasswordHasher  # noqa: E402
+
+ITERATIONS = [100_000, 260_000, 600_000, 1_000_000]
+WORKERS = os.cpu_count() or 1
+LOGINS = 4 * WORKERS
+
+
+def logins_per_second(check, password_hash, logins, threads=1):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        assert all(pool.map(lambda _: check(password_hash, "password"), range(logins)))
+    return logins / (time.perf_counter() - start)
+
+
+def main():
+    print(f"{WORKERS} cores, {LOGINS} logins per measurement")
+    print(f"{'method':>24} {'ms per login':>13} {'logins/s/core':>14} {'pool logins/s':>14}")
+    for iterations in ITERATIONS:
+        method = f"pbkdf2:sha256:{iterations}"
+        password_hash = generate_password_hash("password", method=method, salt_length=16)
+        single_core = logins_per_second(check_password_hash, password_hash, max(LOGINS // WORKERS, 2))
+        hasher = PasswordHasher(method=method, workers=WORKERS, queue=LOGINS)
+        pool = logins_per_second(hasher.verify, password_hash, LOGINS, threads=LOGINS)
+        print(f"{method:>24} {1000 / single_core:>13.1f} {single_core:>14.1f} {pool:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# Load test for the storefront routes. Seeds a throwaway SQLite database with a synthetic catalog, users and orders,
+# then sends requests to each route from several threads at once and reports, per route, the p50/p95/p99 latency,
+# throughput, and SQL queries per request (read from the Server-Timing header, see metrics.py).
+#
+# Two ways to run the app:
+#   client   - the Flask test client, in this process (measures the app itself)
+#   gunicorn - a local gunicorn server with --workers processes (measures the app as it is deployed)
+#
+# Results are written as JSON (with the current git commit) so runs can be compared between commits.
+# Run from the repository root, ie:
+# python benchmarks/storefront.py --mode client --output bench_client.json
+# python benchmarks/storefront.py --mode gunicorn --workers 4 --concurrency 16
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+CATEGORIES = 25
+PRODUCT_IMAGES = ["apple.jpg", "orange.jpg", "broccoli.jpg", "carrots.jpg", "beef.jpg", "chicken.jpg", "fish.jpg",
+                  "ribs.jpg", "hat.jpg", "pants.jpg", "shirt.jpg", "shoes.jpg"]
+PASSWORD = "benchmark password"
+CART_ITEMS = 5
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=["client", "gunicorn"], default="client")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8, help="threads sending requests at once")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--routes", nargs="*", help="only run these routes")
+    parser.add_argument("--output", help="file to write the JSON results to (default: print them)")
+    return parser.parse_args()
+
+
+# --- Synthetic data --- #
+def seed_database(arguments):
+    from main import create_app, password_hasher
+    from models import db, User, Product, Order, OrderItem
+
+    random.seed(0)
+    # The database is empty until it is seeded, so there is nothing to warm.
+    with create_app(WARM_CACHES=False).app_context():
+        db.create_all()
+        db.session.execute(Product.__table__.insert(), [
+            dict(name=f"product {number}", category=f"category_{number % CATEGORIES}",
+                 category_title=f"Category {number % CATEGORIES}", description=f"Synthetic product number {number}.",
+                 price=round(random.uniform(0.25, 50), 2), img=PRODUCT_IMAGES[number % len(PRODUCT_IMAGES)],
+                 stock=1000000)
+            for number in range(arguments.products)
+        ])
+        # Every user shares one password hash, so seeding doesn't have to run the slow hash thousands of times.
+        password_hash = password_hasher.hash(PASSWORD)
+        db.session.execute(User.__table__.insert(), [
+            dict(name=f"user {number}", email=f"user{number}@example.com", password=password_hash)
+            for number in range(arguments.users)
+        ])
+        db.session.execute(Order.__table__.insert(), [
+            dict(id=number + 1, total_price_cents=random.randint(100, 50000),
+                 user_id=random.randint(1, arguments.users))
+            for number in range(arguments.orders)
+        ])
+        db.session.execute(OrderItem.__table__.insert(), [
+            dict(order_id=order_id, product_id=random.randint(1, arguments.products),
+                 quantity=random.randint(1, 5), unit_price_cents=random.randint(25, 5000))
+            for order_id in range(1, arguments.orders + 1) for _ in range(random.randint(1, 4))
+        ])
+        db.session.commit()
+        categories = [category for category, in db.session.query(Product.category).distinct()]
+        products = db.session.query(Product.id, Product.category, Product.name).all()
+    return categories, products
+
+
+# --- Clients --- #
+# Both clients return (status code, Server-Timing header, body) so the routes below work with either, and keep the
+# duration of their last request in last_duration.
+class FlaskClient:
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.last_duration = 0
+
+    def request(self, method, path, data=None):
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, data=data)
+        body = response.get_data(as_text=True)
+        self.last_duration = time.perf_counter() - start
+        return response.status_code, response.headers.get("Server-Timing", ""), body
+
+
+class HttpClient:
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.last_duration = 0
+
+    def request(self, method, path, data=None):
+        start = time.perf_counter()
+        response = self.session.request(method, self.base_url + path, data=data, allow_redirects=False)
+        body = response.text
+        self.last_duration = time.perf_counter() - start
+        return response.status_code, response.headers.get("Server-Timing", ""), body
+
+
+def log_in(client, user_number):
+    _, _, body = client.request("GET", "/login")
+    csrf_token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', body).group(1)
+    return client.request("POST", "/login", dict(csrf_token=csrf_token, email=f"user{user_number}@example.com",
+                                                 password=PASSWORD))
+
+
+# --- Routes --- #
+# Each route is a function that is given a client (logged in as its own user) and returns the measured request's
+# (status code, Server-Timing header, body). Only the last request a route makes is measured, so any setup requests it
+# makes first (ie: adding an item to the cart before checking out) aren't counted.
+def build_routes(categories, products, users):
+    def add_random_product(client):
+        product_id, category, name = random.choice(products)
+        client.request("POST", f"/products/{category}/{name}", dict(add_button=product_id))
+
+    def product_page(client):
+        _, category, name = random.choice(products)
+        return client.request("GET", f"/products/{category}/{name}")
+
+    # The cart page is measured with CART_ITEMS different products in the cart. Items are only added until it has that
+    # many, so the cart doesn't keep growing with every request (the checkout route empties it again).
+    def cart_page(client):
+        _, _, body = client.request("GET", "/api/cart")
+        for _ in range(CART_ITEMS - len(json.loads(body)["items"])):
+            add_random_product(client)
+        return client.request("GET", "/cart")
+
+    def checkout(client):
+        add_random_product(client)
+        return client.request("POST", "/cart", dict(order_button=""))
+
+    return {
+        "/": lambda client: client.request("GET", "/"),
+        "/all": lambda client: client.request("GET", "/all"),
+        "/products/<category>": lambda client: client.request("GET", f"/products/{random.choice(categories)}"),
+        "/products/<category>/<item>": product_page,
+        "/search": lambda client: client.request(
+            "GET", f"/search?q=number {random.randrange(100)}&sort=price_low&max_price=25"),
+        "/api/search": lambda client: client.request(
+            "GET", f"/api/search?q=number {random.randrange(100)}&sort=price_low&max_price=25"),
+        "/cart": cart_page,
+        "/cart checkout": checkout,
+        "/login": lambda client: log_in(client, random.randrange(users)),
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_route(route, clients, count, concurrency):
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    free_clients = list(clients)
+
+    def one_request(_):
+        with lock:
+            client = free_clients.pop()
+        try:
+            status, server_timing, _ = route(client)
+            latency = client.last_duration
+        finally:
+            with lock:
+                free_clients.append(client)
+        query_count = re.search(r'desc="(\d+) queries"', server_timing)
+        with lock:
+            if status >= 400:
+                errors.append(status)
+            latencies.append(latency)
+            if query_count:
+                queries.append(int(query_count.group(1)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(count)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return dict(
+        requests=count,
+        errors=len(errors),
+        throughput_rps=round(count / elapsed, 1),
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+        queries_per_request=round(sum(queries) / len(queries), 2) if queries else None,
+    )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers, environment):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:create_app()", "--workers", str(workers),
+                               "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+                              cwd=REPOSITORY, env=environment)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn didn't start")
+
+
+def main():
+    arguments = parse_arguments()
+    database_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL1"] = f"sqlite:///{database_path}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("SLOW_REQUEST_MS", "1000000")
+
+    seed_start = time.perf_counter()
+    categories, products = seed_database(arguments)
+    seed_time = time.perf_counter() - seed_start
+    print(f"Seeded {arguments.products} products, {arguments.users} users and {arguments.orders} orders in "
+          f"{seed_time:.1f}s", file=sys.stderr)
+
+    server = None
+    if arguments.mode == "gunicorn":
+        server, base_url = start_gunicorn(arguments.workers, dict(os.environ))
+        new_client = lambda: HttpClient(base_url)  # noqa: E731
+    else:
+        from main import create_app
+        app = create_app()
+        new_client = lambda: FlaskClient(app)  # noqa: E731
+
+    try:
+        # Every thread gets its own client, logged in as its own user (so each has its own cart).
+        clients = []
+        for user_number in range(arguments.concurrency):
+            client = new_client()
+            log_in(client, user_number)
+            clients.append(client)
+
+        routes = build_routes(categories, products, arguments.users)
+        results = {}
+        for name, route in routes.items():
+            if arguments.routes and name not in arguments.routes:
+                continue
+            results[name] = run_route(route, clients, arguments.requests, arguments.concurrency)
+            print(f"{name:>30}: {results[name]}", file=sys.stderr)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY, capture_output=True,
+                            text=True).stdout.strip()
+    report = dict(commit=commit, mode=arguments.mode, products=arguments.products, users=arguments.users,
+                  orders=arguments.orders, requests_per_route=arguments.requests,
+                  concurrency=arguments.concurrency, workers=arguments.workers if server else None,
+                  routes=results)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
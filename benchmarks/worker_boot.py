@@ -0,0 +1,86 @@
+# Measures how long a new worker takes to boot and how its first requests compare with steady-state requests.
+# Each scenario runs in a fresh Python process (like a newly started gunicorn worker) against a copy of store.db:
+#   cold           - nothing warmed and no compiled templates on disk, as before create_app/warm_caches
+#   template cache - nothing warmed, but the templates were compiled to the template cache by an earlier run
+#   warmed         - warm_caches runs in create_app (the default), as it does before gunicorn forks its workers
+# For each scenario it reports the import and create_app times, then for every path the first request's time next to
+# the median of the REPEATS requests after it.
+# Run from the repository root:
+# python benchmarks/worker_boot.py
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["/", "/all", "/products/meats", "/products/clothes/hat", "/search?q=fresh", "/login"]
+REPEATS = 20
+SCENARIOS = {
+    "cold": dict(warm_caches=False, template_cache="empty"),
+    "template cache": dict(warm_caches=False, template_cache="filled"),
+    "warmed": dict(warm_caches=True, template_cache="filled"),
+}
+
+
+# Runs in the child process, prints its timings as JSON.
+def measure_boot(warm_caches, template_cache_dir):
+    start = time.perf_counter()
+    sys.path.insert(0, REPOSITORY)
+    from main import create_app
+    imported = time.perf_counter()
+    app = create_app(WARM_CACHES=warm_caches, TEMPLATE_CACHE_DIR=template_cache_dir, REPORT_DATABASE_SETTINGS=False)
+    created = time.perf_counter()
+
+    client = app.test_client()
+    paths = {}
+    for path in PATHS:
+        request_start = time.perf_counter()
+        client.get(path)
+        first = time.perf_counter() - request_start
+        durations = []
+        for _ in range(REPEATS):
+            request_start = time.perf_counter()
+            client.get(path)
+            durations.append(time.perf_counter() - request_start)
+        paths[path] = dict(first_ms=round(first * 1000, 2), steady_ms=round(statistics.median(durations) * 1000, 2))
+    print(json.dumps(dict(import_ms=round((imported - start) * 1000, 1),
+                          create_app_ms=round((created - imported) * 1000, 1), paths=paths)))
+
+
+def run_scenario(warm_caches, template_cache_dir, environment):
+    output = subprocess.run([sys.executable, __file__, "--child", str(warm_caches), template_cache_dir],
+                            cwd=REPOSITORY, env=environment, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    temporary_dir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(REPOSITORY, "store.db"), os.path.join(temporary_dir, "store.db"))
+    environment = dict(os.environ, DATABASE_URL1=f"sqlite:///{os.path.join(temporary_dir, 'store.db')}",
+                       SLOW_REQUEST_MS="1000000")
+    environment.setdefault("SECRET_KEY", "benchmark")
+
+    filled_cache_dir = os.path.join(temporary_dir, "template_cache_filled")
+    # Fills the template cache the way an earlier worker (or deploy) would.
+    run_scenario(True, filled_cache_dir, environment)
+
+    for name, scenario in SCENARIOS.items():
+        if scenario["template_cache"] == "empty":
+            template_cache_dir = tempfile.mkdtemp(dir=temporary_dir)
+        else:
+            template_cache_dir = filled_cache_dir
+        result = run_scenario(scenario["warm_caches"], template_cache_dir, environment)
+        print(f"{name}: import {result['import_ms']}ms, create_app {result['create_app_ms']}ms")
+        for path, timings in result["paths"].items():
+            print(f"  {path:>25}: first {timings['first_ms']:>7}ms, steady {timings['steady_ms']:>6}ms")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        measure_boot(sys.argv[2] == "True", sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,98 @@
+from collections import namedtuple
+from flask import session
+
+# The cart is stored in the user's (signed) session cookie rather than in a module level list, so every visitor gets
+# their own cart and it doesn't matter which gunicorn worker ends up serving the request.
+# Inside the session the cart looks like this:
+# session["cart"] = {"items": {"3": 2, "11": 1}, "size": 3}
+# "items" maps a product id to its quantity (the keys are strings because the session is serialized to JSON), and
+# "size" is the running total of units in the cart so the navbar never has to add the quantities up.
+CART_SESSION_KEY = "cart"
+# Most units of a single product a cart can hold. Also keeps quantities within what the database can store for an order.
+MAX_CART_QUANTITY = 99
+
+
+# Raised when an item would go over MAX_CART_QUANTITY. The cart is left as it was.
+class QuantityTooLarge(Exception):
+    pass
+
+
+class SessionCart:
+
+    def __init__(self, store=None):
+        self.store = session if store is None else store
+
+    @property
+    def _cart(self):
+        # Reading an empty cart doesn't write anything, so visitors who never add an item don't get a session cookie.
+        return self.store.get(CART_SESSION_KEY, {"items": {}, "size": 0})
+
+    def _changed(self):
+        # Flask only notices changes to the top level of the session, so nested edits have to be flagged manually.
+        if hasattr(self.store, "modified"):
+            self.store.modified = True
+
+    @property
+    def size(self):
+        return self._cart["size"]
+
+    def quantity(self, product_id):
+        return self._cart["items"].get(str(product_id), 0)
+
+    def items(self):
+        # Returns {product_id: quantity} with the ids turned back into integers.
+        return {int(product_id): quantity for product_id, quantity in self._cart["items"].items()}
+
+    def add(self, product_id, quantity=1):
+        self.update(product_id, self.quantity(product_id) + quantity)
+
+    def update(self, product_id, quantity):
+        # Sets an item to an exact quantity. A quantity of 0 (or less) removes the item from the cart.
+        key = str(product_id)
+        quantity = max(int(quantity), 0)
+        if quantity > MAX_CART_QUANTITY:
+            raise QuantityTooLarge(f"Only {MAX_CART_QUANTITY} of an item can be added to the cart.")
+        cart = self.store.setdefault(CART_SESSION_KEY, {"items": {}, "size": 0})
+        cart["size"] += quantity - cart["items"].get(key, 0)
+        if quantity:
+            cart["items"][key] = quantity
+        else:
+            cart["items"].pop(key, None)
+        self._changed()
+
+    def remove(self, product_id):
+        self.update(product_id, 0)
+
+    def clear(self):
+        self.store.pop(CART_SESSION_KEY, None)
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+
+def get_cart():
+    return SessionCart()
+
+
+# A single line on the cart page (or in an order): the Product database entry, how many of it are in the cart, and
+# the price of that line (product price * quantity).
+CartLine = namedtuple("CartLine", ["product", "quantity", "line_total"])
+# The whole cart once it has been matched up with the products: the lines in alphabetical order and the total price.
+CartSummary = namedtuple("CartSummary", ["lines", "total_price"])
+
+
+# Builds a CartSummary from the products in the cart and the cart's {product_id: quantity} pairs in a single pass.
+# products should already be in the order they are to be displayed. Products that aren't in the cart are ignored.
+def summarize_cart(products, quantities):
+    lines = []
+    total_price = 0
+    for product in products:
+        quantity = quantities.get(product.id, 0)
+        if quantity:
+            line_total = product.price * quantity
+            lines.append(CartLine(product, quantity, line_total))
+            total_price += line_total
+    return CartSummary(lines, total_price)
@@ -0,0 +1,140 @@
+from collections import namedtuple
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.local import LocalProxy
+from models import Product
+
+# The product catalog hardly ever changes, so instead of querying the products table on every page view, the browse
+# routes read from an in-memory copy of it that is held by each worker (one per app, see init_catalog).
+# The copy is rebuilt:
+#   - as soon as a change to a Product is committed from this worker (see the session events at the bottom), and
+#   - at least every CATALOG_TTL seconds, so changes committed by other workers (or directly in the database) are
+#     picked up too.
+CATALOG_TTL = 300
+
+# Products are cached as plain read-only tuples rather than database entries, so they can be shared between requests
+# without being tied to (or expired by) any request's database session. They have the same attributes as Product.
+CatalogProduct = namedtuple("CatalogProduct", ["id", "name", "category", "category_title", "description", "price",
+                                               "img"])
+
+
+# A snapshot is everything the browse pages need, built in one go from a single query:
+# products      - all products ordered by id
+# by_id/by_name - product lookups by id and by name
+# by_category   - {category: [products in that category]}
+# categories    - [(category, category_title)] pairs ordered by category_title, ie:
+#                 [("clothes", "Clothes"), ("fruits_and_vegetables", "Fruits & Vegetables"), ("meats", "Meats & Fish")]
+class CatalogSnapshot:
+
+    def __init__(self, products, generation, version):
+        self.generation = generation
+        self.version = version
+        self.products = products
+        self.by_id = {product.id: product for product in products}
+        self.by_name = {product.name: product for product in products}
+        self.by_category = {}
+        category_titles = {}
+        for product in products:
+            self.by_category.setdefault(product.category, []).append(product)
+            category_titles.setdefault(product.category, product.category_title)
+        self.categories = sorted(category_titles.items(), key=lambda category: category[1])
+
+
+class ProductCatalog:
+
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._expires_at = 0
+        # Bumped every time the products change. A snapshot built from an older generation is rebuilt on next use.
+        self._generation = 0
+        # Number of snapshots built so far, used as the catalog's version.
+        self._builds = 0
+        # Functions to call when the products change, ie: to clear other caches built from the catalog.
+        self._invalidation_callbacks = []
+
+    def on_invalidate(self, callback):
+        self._invalidation_callbacks.append(callback)
+        return callback
+
+    def invalidate(self):
+        self._generation += 1
+        for callback in self._invalidation_callbacks:
+            callback()
+
+    def _is_fresh(self, snapshot):
+        return (snapshot is not None and snapshot.generation == self._generation
+                and time.monotonic() < self._expires_at)
+
+    def _load(self):
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+        with self._lock:
+            # Another thread may have rebuilt the snapshot while we were waiting for the lock.
+            snapshot = self._snapshot
+            if not self._is_fresh(snapshot):
+                generation = self._generation
+                products = [CatalogProduct(product.id, product.name, product.category, product.category_title,
+                                           product.description, product.price, product.img)
+                            for product in Product.query.order_by(Product.id).all()]
+                self._builds += 1
+                snapshot = CatalogSnapshot(products, generation, self._builds)
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + self.ttl
+            return snapshot
+
+    @property
+    def version(self):
+        # Changes whenever the cached catalog is rebuilt, so it can be used as part of other cache keys.
+        return self._load().version
+
+    def all(self):
+        return self._load().products
+
+    def get(self, product_id):
+        return self._load().by_id.get(product_id)
+
+    def get_by_name(self, name):
+        return self._load().by_name.get(name)
+
+    def in_category(self, category):
+        return self._load().by_category.get(category, [])
+
+    def categories(self):
+        return self._load().categories
+
+
+# Every app has its own catalog, made by create_app (see main.py), so two apps in the same process (ie: in a script or a
+# benchmark) never serve each other's products. product_catalog is the catalog of the current app.
+def init_catalog(app, ttl=CATALOG_TTL):
+    catalog = app.extensions["product_catalog"] = ProductCatalog(ttl)
+    return catalog
+
+
+product_catalog = LocalProxy(lambda: current_app.extensions["product_catalog"])
+
+
+# Any flush that adds, changes or deletes a Product marks the session, and once that session commits the current app's
+# catalog is invalidated. Rolled back changes leave the catalog alone.
+@event.listens_for(Session, "after_flush")
+def _track_product_changes(session, flush_context):
+    if any(isinstance(instance, Product) for instance in (*session.new, *session.dirty, *session.deleted)):
+        session.info["products_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_catalog(session):
+    if session.info.pop("products_changed", False) and has_app_context():
+        catalog = current_app.extensions.get("product_catalog")
+        if catalog is not None:
+            catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_product_changes(session):
+    session.info.pop("products_changed", None)
@@ -0,0 +1,96 @@
+from sqlalchemy import and_, bindparam
+from sqlalchemy.exc import IntegrityError
+from models import db, to_cents, Product, Order, OrderItem
+
+# Placing an order, as a single database transaction:
+#   1. The order is inserted, which claims its idempotency key (see below).
+#   2. Every item's stock is taken with a conditional UPDATE (... SET stock = stock - quantity WHERE stock >= quantity),
+#      so two checkouts can never both take the last unit: the second UPDATE matches no row and the order is cancelled.
+#      Items are updated in product id order, so concurrent checkouts lock the same rows in the same order and can't
+#      deadlock each other (on Postgres).
+#   3. The order's items are inserted.
+# Nothing is kept if any step fails: the transaction is rolled back and the stock is left as it was.
+#
+# Every checkout carries an idempotency key (ie: the checkout_key the cart page puts in its form). An order placed with
+# a key is stored with it, and placing an order with the same key again returns that order instead of a new one, so a
+# double-clicked button or a re-sent form only ever places one order. Keys are unique per user (see
+# order_idempotency_index in models.py). The order is inserted before any stock is taken, so when two requests with
+# the same key arrive at the same time, the second one waits on the first one's insert and then fails on the unique
+# key, and returns the first one's order rather than competing with it for the stock.
+# Keys can be at most IDEMPOTENCY_KEY_MAX_LENGTH characters long, the size of the column they are stored in.
+IDEMPOTENCY_KEY_MAX_LENGTH = Order.idempotency_key.type.length
+
+
+# Raised when an idempotency key is too long to be stored.
+class InvalidIdempotencyKey(Exception):
+    pass
+
+
+# Raised when some items don't have enough stock left. products is [(product, units left)].
+class OutOfStock(Exception):
+
+    def __init__(self, products):
+        super().__init__(", ".join(product.name for product, _ in products))
+        self.products = products
+
+
+def find_order(user_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+
+
+def take_stock(quantities):
+    take_stock_statement = Product.__table__.update().where(and_(
+        Product.id == bindparam("product_id"), Product.stock >= bindparam("quantity")
+    )).values(stock=Product.stock - bindparam("quantity"))
+    out_of_stock = []
+    for product_id, quantity in sorted(quantities.items()):
+        result = db.session.execute(take_stock_statement, dict(product_id=product_id, quantity=quantity))
+        if result.rowcount != 1:
+            out_of_stock.append(product_id)
+    if out_of_stock:
+        db.session.rollback()
+        products = Product.query.filter(Product.id.in_(out_of_stock)).order_by(Product.name).all()
+        raise OutOfStock([(product, product.stock) for product in products])
+
+
+# Places an order for {product id: quantity}. Returns (order, True) for a new order, or (order, False) for the order
+# already placed with idempotency_key. Returns (None, False) when there is nothing to order. Raises OutOfStock when
+# some items don't have enough stock, or InvalidIdempotencyKey when the key is too long.
+def place_order(user_id, quantities, idempotency_key=None):
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise InvalidIdempotencyKey(f"Idempotency keys can be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters long.")
+    existing_order = find_order(user_id, idempotency_key)
+    if existing_order is not None:
+        return existing_order, False
+    # Products that no longer exist are left out of the order.
+    prices = dict(db.session.query(Product.id, Product.price).filter(Product.id.in_(quantities)))
+    quantities = {product_id: quantity for product_id, quantity in quantities.items()
+                  if product_id in prices and quantity > 0}
+    if not quantities:
+        return None, False
+
+    # Each item is stored with the price of a single unit at the time of purchase, in cents.
+    order_item_rows = [dict(product_id=product_id, quantity=quantity, unit_price_cents=to_cents(prices[product_id]))
+                       for product_id, quantity in quantities.items()]
+    new_order = Order(total_price_cents=sum(row["unit_price_cents"] * row["quantity"] for row in order_item_rows),
+                      user_id=user_id, idempotency_key=idempotency_key or None)
+    try:
+        # The order is flushed first to claim its key and get its id, then the stock is taken, then all of its items
+        # are inserted with a single bulk insert.
+        db.session.add(new_order)
+        db.session.flush()
+    except IntegrityError:
+        # Another request placed an order with the same key first.
+        db.session.rollback()
+        existing_order = find_order(user_id, idempotency_key)
+        if existing_order is None:
+            raise
+        return existing_order, False
+    take_stock(quantities)
+    for row in order_item_rows:
+        row["order_id"] = new_order.id
+    db.session.execute(OrderItem.__table__.insert(), order_item_rows)
+    db.session.commit()
+    return new_order, True
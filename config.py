@@ -0,0 +1,54 @@
+import os
+from database import database_uri, engine_options
+
+# App settings for create_app in main.py. Which config is used is picked with the APP_CONFIG environment variable
+# (production, development or testing) and defaults to production.
+# Secrets and the database still come from environment variables (see database.py for the database settings).
+
+
+class Config:
+    # CSRF_TOKEN to use FlaskForms - stored as env variable
+    SECRET_KEY = os.environ.get("SECRET_KEY")
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Compiled templates are saved to this folder (the app's instance folder by default), so a new worker loads them
+    # instead of compiling every template again. Templates whose source changed are compiled again automatically.
+    TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR")
+    # Load the product catalog, search index and templates, and render the WARM_PATHS pages once when the app is
+    # created, so the app's first real request is as fast as any other (see warm_caches in main.py).
+    WARM_CACHES = True
+    WARM_PATHS = ["/", "/all"]
+    # Print the database settings in use on startup (see database.py).
+    REPORT_DATABASE_SETTINGS = True
+    # Users who can see the sales reports at /admin/reports, as comma separated emails, ie: "chris@example.com".
+    ADMIN_EMAILS = [email.strip() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()]
+
+
+class ProductionConfig(Config):
+    pass
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+    # Templates change often while developing, and the dev server restarts on every code change.
+    WARM_CACHES = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    WARM_CACHES = False
+    REPORT_DATABASE_SETTINGS = False
+
+
+CONFIGS = {
+    "production": ProductionConfig,
+    "development": DevelopmentConfig,
+    "testing": TestingConfig,
+}
+
+
+def get_config(name=None):
+    return CONFIGS[name or os.environ.get("APP_CONFIG", "production")]
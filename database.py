@@ -0,0 +1,82 @@
+import os
+import sqlite3
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# Database settings. The database is set with DATABASE_URL1 (ie: the Postgres database on Heroku) and defaults to the
+# SQLite store.db in the repository.
+#
+# Postgres (environment variables):
+# DB_POOL_SIZE     - connections kept open per worker
+# DB_MAX_OVERFLOW  - extra connections a worker may open when the pool is in use
+# DB_POOL_TIMEOUT  - seconds to wait for a free connection
+# DB_POOL_RECYCLE  - seconds after which a connection is replaced (Heroku closes idle connections)
+# Connections are also checked before use (pool_pre_ping), so a dropped connection doesn't fail a request.
+#
+# SQLite: every connection is set up with the pragmas in SQLITE_PRAGMAS. WAL lets readers carry on while another
+# gunicorn worker writes, instead of every worker waiting on one lock for the whole file. A file database also gets a
+# pool (DB_POOL_SIZE, DB_MAX_OVERFLOW and DB_POOL_TIMEOUT as above), so each connection is opened and set up once and
+# then reused by later requests, rather than opened again, with every pragma, for each request. The worker's threads
+# take turns with the pooled connections, so they aren't tied to the thread that opened them (check_same_thread).
+DATABASE_URL = os.environ.get('DATABASE_URL1', "sqlite:///store.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 64 * 1024 * 1024)),
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_KB", 16 * 1024)),
+    "temp_store": "MEMORY",
+}
+
+
+def database_uri(url=DATABASE_URL):
+    # Heroku still hands out postgres:// URLs, which SQLAlchemy 1.4 no longer accepts.
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def engine_options(uri):
+    if uri.startswith("postgresql"):
+        return dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True)
+    if uri.startswith("sqlite") and uri not in ("sqlite://", "sqlite:///:memory:"):
+        return dict(poolclass=QueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT, connect_args={"check_same_thread": False})
+    return {}
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+
+# The settings the database is actually running with, as {setting: value}. For SQLite the pragmas are read back from
+# the database, since it may ignore some (ie: WAL isn't available for in-memory databases).
+def database_settings(engine):
+    settings = {"database": engine.url.render_as_string(hide_password=True), "pool": type(engine.pool).__name__}
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            for pragma in SQLITE_PRAGMAS:
+                settings[pragma] = connection.execute(text(f"PRAGMA {pragma}")).scalar()
+    else:
+        settings.update(engine_options(engine.url.drivername))
+    return settings
+
+
+def report_database_settings(app, db):
+    with app.app_context():
+        settings = database_settings(db.engine)
+        print("Database settings: " + ", ".join(f"{setting}={value}" for setting, value in settings.items()),
+              flush=True)
+        # Connections opened here shouldn't be shared with the gunicorn workers forked after startup.
+        db.engine.dispose()
@@ -0,0 +1,38 @@
+import random
+import threading
+import time
+
+# The "Featured Items" carousel on the home page shows FEATURED_ITEMS_COUNT products picked at random from the catalog.
+# Instead of picking new items on every page view, a new set is picked once per FEATURED_ITEMS_WINDOW seconds. The
+# random picks are seeded with the window number, so every worker shows the same set during a window and the home page
+# can be cached for that long.
+FEATURED_ITEMS_COUNT = 8
+FEATURED_ITEMS_WINDOW = 60 * 60
+
+
+class FeaturedItems:
+
+    def __init__(self, catalog, count=FEATURED_ITEMS_COUNT, window=FEATURED_ITEMS_WINDOW):
+        self.catalog = catalog
+        self.count = count
+        self.window = window
+        self._lock = threading.Lock()
+        # (window number, catalog version, featured products) of the last set that was picked.
+        self._current = (None, None, [])
+
+    def current_window(self, now=None):
+        return int((time.time() if now is None else now) // self.window)
+
+    def items(self, window=None):
+        window = self.current_window() if window is None else window
+        version = self.catalog.version
+        current_window, current_version, featured_items = self._current
+        if (current_window, current_version) != (window, version):
+            with self._lock:
+                # random.sample picks distinct ids in one step. With fewer products than count, all of them are
+                # featured (in a random order).
+                product_ids = sorted(product.id for product in self.catalog.all())
+                picked_ids = random.Random(window).sample(product_ids, min(self.count, len(product_ids)))
+                featured_items = [self.catalog.get(product_id) for product_id in picked_ids]
+                self._current = (window, version, featured_items)
+        return featured_items
@@ -0,0 +1,23 @@
+# gunicorn settings, read automatically when gunicorn is started from the repository root (see Procfile).
+import os
+
+# The app is created once in the master process, before the workers are forked, and warms its caches as it is created
+# (see warm_caches in main.py). Every worker then starts with the catalog, search index, compiled templates and cached
+# pages already in memory, shares that memory with the other workers, and serves its first request as fast as any
+# other. Set GUNICORN_PRELOAD=0 to have each worker create (and warm) its own app instead.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Each worker serves GUNICORN_THREADS requests at once. A login waits on the password hashing pool (see passwords.py)
+# without holding up the worker's other threads, so a burst of logins doesn't stall every other route, as it would with
+# single threaded workers. The app's shared caches are guarded by locks, so they are safe to use from several threads.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+
+def post_fork(server, worker):
+    # Database connections can't be shared between processes. warm_caches closes the ones it opened, and this makes
+    # sure a worker never starts with one inherited from the master.
+    if server.cfg.preload_app:
+        from models import db
+        with server.app.wsgi().app_context():
+            db.engine.dispose()
@@ -0,0 +1,124 @@
+# The product and category photos in static/ are full size camera images (up to ~4 MB each), but they are only ever
+# displayed as small square thumbnails (15rem at most, see styles.css). This module builds smaller copies of each photo
+# and helps the templates use them.
+#
+# Build step (run from the repository root whenever a photo in static/ is added or changed, requires Pillow):
+# python images.py
+# For every .jpg in static/ it writes square, center-cropped copies at each of IMAGE_WIDTHS in JPEG, WebP and (when the
+# installed Pillow supports it) AVIF to static/img/. Each file name contains a hash of its contents,
+# ie: static/img/hat-240.3f9a1c2b7e.webp, so a changed image always gets a new URL and browsers can cache every
+# file in static/img/ forever. The files that were built are listed in static/img/manifest.json:
+# {"hat.jpg": {"jpeg": {"240": "img/hat-240.1a2b3c4d5e.jpg", ...}, "webp": {...}, "avif": {...}}, ...}
+import hashlib
+import json
+import os
+from flask import url_for
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+IMAGE_FOLDER = "img"
+MANIFEST_PATH = os.path.join(STATIC_FOLDER, IMAGE_FOLDER, "manifest.json")
+# Thumbnails are displayed at up to 15rem (240px), so these cover 1x, 2x and 3x screens.
+IMAGE_WIDTHS = [240, 480, 720]
+# {format: (Pillow format name, file extension, save options)}, in the order browsers should prefer them.
+IMAGE_FORMATS = {
+    "avif": ("AVIF", "avif", {"quality": 55}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 6}),
+    "jpeg": ("JPEG", "jpg", {"quality": 80, "optimize": True, "progressive": True}),
+}
+# Cache-Control header for the content-hashed files in static/img/.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImageVariants:
+
+    def __init__(self, variants):
+        # variants is one manifest entry: {format: {width: path}}
+        self.variants = variants
+
+    def formats(self):
+        # The optional formats (AVIF/WebP) that were built, best first. JPEG is always the <img> fallback.
+        return [image_format for image_format in IMAGE_FORMATS if image_format in self.variants
+                and image_format != "jpeg"]
+
+    def srcset(self, image_format="jpeg"):
+        return ", ".join(f"{url_for('static', filename=path)} {width}w"
+                         for width, path in sorted(self.variants[image_format].items(), key=lambda item: int(item[0])))
+
+    @property
+    def src(self):
+        # The smallest JPEG, for browsers that don't support srcset.
+        widths = self.variants["jpeg"]
+        return url_for("static", filename=widths[min(widths, key=int)])
+
+
+class ImageManifest:
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        try:
+            with open(path) as manifest_file:
+                self.images = json.load(manifest_file)
+        except FileNotFoundError:
+            # Without a manifest (ie: the build step hasn't been run) the templates fall back to the original photos.
+            self.images = {}
+
+    def variants(self, filename):
+        if filename in self.images:
+            return ImageVariants(self.images[filename])
+        return None
+
+
+def is_immutable_static_file(filename):
+    return filename.startswith(IMAGE_FOLDER + "/") and not filename.endswith(".json")
+
+
+# --- Build step --- #
+def _save_variant(image, original_name, width, image_format):
+    pillow_format, extension, options = IMAGE_FORMATS[image_format]
+    output_path = os.path.join(STATIC_FOLDER, IMAGE_FOLDER, "building")
+    image.save(output_path, pillow_format, **options)
+    with open(output_path, "rb") as output_file:
+        content_hash = hashlib.sha256(output_file.read()).hexdigest()[:10]
+    filename = f"{IMAGE_FOLDER}/{os.path.splitext(original_name)[0]}-{width}.{content_hash}.{extension}"
+    os.replace(output_path, os.path.join(STATIC_FOLDER, filename))
+    return filename
+
+
+def build_images():
+    from PIL import Image, ImageOps, features
+
+    image_formats = [image_format for image_format in IMAGE_FORMATS
+                     if image_format == "jpeg" or features.check(image_format)]
+    os.makedirs(os.path.join(STATIC_FOLDER, IMAGE_FOLDER), exist_ok=True)
+    old_files = set(os.listdir(os.path.join(STATIC_FOLDER, IMAGE_FOLDER)))
+
+    manifest = {}
+    for original_name in sorted(os.listdir(STATIC_FOLDER)):
+        if not original_name.lower().endswith((".jpg", ".jpeg")):
+            continue
+        with Image.open(os.path.join(STATIC_FOLDER, original_name)) as original:
+            # Lets the JPEG decoder skip straight to a smaller scale, which is much faster than decoding full size.
+            original.draft("RGB", (max(IMAGE_WIDTHS), max(IMAGE_WIDTHS)))
+            image = ImageOps.exif_transpose(original).convert("RGB")
+        manifest[original_name] = {image_format: {} for image_format in image_formats}
+        for width in IMAGE_WIDTHS:
+            # Every thumbnail on the site is a square with object-fit: cover, so the variants are cropped to match.
+            variant = ImageOps.fit(image, (width, width), Image.LANCZOS)
+            for image_format in image_formats:
+                manifest[original_name][image_format][str(width)] = _save_variant(variant, original_name, width,
+                                                                                  image_format)
+        print(f"{original_name}: {os.path.getsize(os.path.join(STATIC_FOLDER, original_name)) // 1024} KB -> "
+              f"{', '.join(image_formats)} at {', '.join(str(width) for width in IMAGE_WIDTHS)}px")
+
+    with open(MANIFEST_PATH, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    # Remove variants from previous builds that are no longer in the manifest.
+    new_files = {os.path.basename(path) for variants in manifest.values() for widths in variants.values()
+                 for path in widths.values()}
+    for stale_file in old_files - new_files - {os.path.basename(MANIFEST_PATH)}:
+        os.remove(os.path.join(STATIC_FOLDER, IMAGE_FOLDER, stale_file))
+
+
+if __name__ == "__main__":
+    build_images()
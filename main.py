@@ -1,245 +1,246 @@
-from flask import Flask, render_template, url_for, redirect, flash, request, abort
+from flask import Flask, Blueprint, render_template, url_for, redirect, flash, request, abort, jsonify, current_app, \
+    Response, stream_with_context
 from forms import LoginForm, RegistrationForm, EditForm
+from config import get_config
+from metrics import init_metrics, request_metrics
+from database import report_database_settings
+from models import db, User, Product, Order
+from cart import get_cart, summarize_cart, QuantityTooLarge
+from checkout import place_order, OutOfStock, InvalidIdempotencyKey
+from analytics import rolled_up_to, sales_report, sales_rows, REPORT_GROUPS, CSV_COLUMNS
+from catalog import init_catalog, product_catalog
+from featured import FeaturedItems
+from search import SearchIndex, SEARCH_SORTS, SEARCH_RESULTS_PER_PAGE
+from user_cache import init_user_cache, user_cache
+from passwords import PasswordHasher, PasswordHasherBusy
+from response_cache import ResponseCache, render_shared_page, HOME_GREETING_PLACEHOLDER
+from images import ImageManifest, is_immutable_static_file, IMMUTABLE_CACHE_CONTROL
 from flask_bootstrap import Bootstrap
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin, login_user, LoginManager, current_user, logout_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_login import login_user, LoginManager, current_user, logout_user
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
+from collections import namedtuple
+import csv
+import io
+import itertools
 import os
-import random
 import datetime
+import time
+import uuid
 
-app = Flask(__name__)
-# CSRF_TOKEN to use FlaskForms - stored as env variable
-app.config["SECRET_KEY"] = os.environ.get('SECRET_KEY')
-# Enable Bootstrap for WTForms
-Bootstrap(app)
+# The store's routes. They are added to the app by create_app at the bottom of this file.
+store = Blueprint("store", __name__)
+
+# Resized product images built by images.py. The templates use image_variants to list every size and format of an image
+# (see templates/image.html).
+image_manifest = ImageManifest()
+
+
+@store.after_app_request
+def cache_static_images(response):
+    # The resized images have a hash of their contents in their file names, so their URLs never point at different
+    # content and browsers can keep them without checking back.
+    if request.endpoint == "static" and is_immutable_static_file(request.view_args.get("filename", "")):
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+# Used for the footer copyright year. Looked up on every render so long running workers move on to a new year.
+def current_year():
+    return datetime.date.today().year
+
+
+@store.app_context_processor
+def inject_copyright_year():
+    return dict(copyright_year=current_year())
+
+
+# What each app keeps in memory, made by create_app (see init_store) and kept in app.extensions["store"], so two apps in
+# the same process (ie: in a script or a benchmark) never share cached pages, products or users:
+# page_cache      - the rendered catalog pages shared by all users (see response_cache.py). Cached pages are dropped
+#                   whenever the products change.
+# featured_items  - the home page's featured items (see featured.py)
+# search_index    - the product search index (see search.py)
+# password_hasher - hashes and checks passwords. The hashing method and cost are set with environment variables (see
+#                   passwords.py).
+# The routes use them through the names below, which always point at the current app's.
+StoreState = namedtuple("StoreState", ["page_cache", "featured_items", "search_index", "password_hasher"])
+
+
+def init_store(app):
+    catalog = init_catalog(app)
+    init_user_cache(app)
+    store_page_cache = ResponseCache()
+    catalog.on_invalidate(store_page_cache.clear)
+    app.extensions["store"] = StoreState(store_page_cache, FeaturedItems(catalog), SearchIndex(catalog),
+                                         PasswordHasher())
+
+
+page_cache = LocalProxy(lambda: current_app.extensions["store"].page_cache)
+featured_items = LocalProxy(lambda: current_app.extensions["store"].featured_items)
+search_index = LocalProxy(lambda: current_app.extensions["store"].search_index)
+password_hasher = LocalProxy(lambda: current_app.extensions["store"].password_hasher)
+
+
+# Renders one of the catalog pages through page_cache. The cache key is the route, its arguments, and the catalog
+# version, so a new catalog never serves pages rendered from the old one.
+def render_catalog_page(template_name, **context):
+    key = (request.endpoint, tuple(sorted(request.view_args.items())), product_catalog.version, current_year())
+    return render_shared_page(page_cache, key, template_name,
+                              dict(logged_in=current_user.is_authenticated, cart_size=get_cart().size), **context)
 
-# Enable SQL Database
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL1', "sqlite:///store.db")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
 
 # --- flask_login script --- #
 login_manager = LoginManager()
-login_manager.init_app(app)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
-# Database models
-class User(UserMixin, db.Model):
-    __tablename__ = "users"
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(250), nullable=False, unique=True)
-    password = db.Column(db.String(250), nullable=False)
-    orders = db.relationship("Order", backref="user", lazy=True)
-
-
-class Product(db.Model):
-    __tablename__ = "products"
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False, unique=True)
-    # category is what is used to pass as a variable. category_title is used as the text on webpages.
-    # For example for fruits and vegetables:
-    # category = fruits_and_vegetables
-    # category_title = Fruits & Vegetables
-    category = db.Column(db.String(100), nullable=False)
-    category_title = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.Text, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    img = db.Column(db.String(100), nullable=False)
-
-
-class Order(db.Model):
-    __tablename__ = "orders"
-    id = db.Column(db.Integer, primary_key=True)
-    items = db.Column(db.String(2000), nullable=False)
-    quantity = db.Column(db.String(100), nullable=False)
-    total_price = db.Column(db.String(50), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-
-
-# Used for the footer copyright year. Dynamic so it doesn't need to be manually updated.
-copyright_year = datetime.datetime.now().year
-
-# shopping_cart is used throughout the website.
-# Items added to the cart will be appended to the shopping_cart list.
-shopping_cart = []
-
-
-# convert_shopping_cart is used to pass a new variable created from the original shopping_cart which contains all the
-# user items they have added. If we pass a shopping_cart containing 2 shirts and 3 oranges, the shopping_cart would
-# look like this: [orange, orange, orange, shirt, shirt]. convert_shopping_cart will take those items, pass them into
-# final_shopping_cart as single items, and then create an additional list (quantity_list) containing the quantities,
-# and the quantity for any respective item would be at the same index.
-# Therefore, shopping_cart = [orange, orange, orange, shirt, shirt] would be converted into the following:
-# final_shopping_cart = [orange, shirt]
-# quantity_list = [3, 2]
-# This seemed like a better way to list quantities for each item on the cart page, and also for Order database entry
-# once the order is finalized.
-def convert_shopping_cart(shopping_cart):
-    final_shopping_cart = []
-    quantity_list = []
-    # sort shopping_cart in alphabetical order and group multiples of the same items together
-    shopping_cart.sort()
-    # each item in shopping_cart will have a minimum quantity of 1. This is used to keep count of each item's quantity.
-    quantity = 1
-    # count is used and increased by one per shopping_cart iteration for specifically the last item in shopping_cart,
-    # the algorithm logic does not work well without it
-    count = -1
-    for item in shopping_cart:
-        # 1. This is specifically if there's only a single item with quantity of 1. Required as the rest of the for loop
-        # does not account for this.
-        if len(shopping_cart) == 1:
-            final_shopping_cart.append(item)
-            quantity_list.append(1)
-        else:
-            count += 1
-            # 2. first item in the shopping cart is always appended
-            if not final_shopping_cart:
-                final_shopping_cart.append(item)
-            # 3. logic for the last item in shopping_cart
-            elif count == (len(shopping_cart) - 1):
-                # if the item already exists in shopping_cart, the quantity is increased by one and this item's
-                # quantity is appended to quantity_list
-                if item in final_shopping_cart:
-                    quantity += 1
-                    quantity_list.append(quantity)
-                # if the item does not exist in shopping_cart, the quantity of the previous item is appended, and
-                # because the current/last item does not exist in the cart, a quantity of 1 is then appended to
-                # quantity_list for the last item, and the item itself is appended to the final_shopping_cart list
-                else:
-                    quantity_list.append(quantity)
-                    quantity_list.append(1)
-                    final_shopping_cart.append(item)
-            # 4. if item exists in shopping_cart already, quantity is increased by 1
-            elif item in final_shopping_cart:
-                quantity += 1
-            # 5. if the current item does not exist in the final_shopping_cart, the previous item's quantity is
-            # appended to quantity_list, quantity is reset to 1, and the new item is appended to final_shopping_cart
-            elif item not in final_shopping_cart and quantity > 1:
-                quantity_list.append(quantity)
-                quantity = 1
-                final_shopping_cart.append(item)
-            # 6. this is identical to step 4. but if the quantity is = 1, the quantity does not need to be reset
-            else:
-                quantity_list.append(quantity)
-                final_shopping_cart.append(item)
+    # Served from the user cache (see user_cache.py), so most requests don't need to query the users table.
+    return user_cache.get(int(user_id))
 
-    # List comprehension. Since we initially passed strings to the shopping cart, we turn them into the
-    # SQL database entries to access the images, descriptions, etc. for each item in the final_shopping_cart for the
-    # cart page.
-    final_shopping_cart = [Product.query.filter_by(name=string_item).first() for string_item in
-                           final_shopping_cart]
-    return final_shopping_cart, quantity_list
 
+# Number of previous orders shown per page on the account page.
+ORDERS_PER_PAGE = 10
 
-# Sums the items and their quantities from their respective lists to give a final price in the cart.
-def total_price_calculator(shopping_cart_to_calculate, quantity_list_to_calculate):
-    calculated_price = 0
-    for item in shopping_cart_to_calculate:
-        calculated_price += item.price * quantity_list_to_calculate[shopping_cart_to_calculate.index(item)]
-    calculated_price_string = "{:.2f}".format(calculated_price)
-    return calculated_price_string
+
+# The shopping cart is stored per user in their session (see cart.py), keyed by product id with the quantity of
+# each item, ie: a cart with 3 oranges and 2 shirts is {orange_id: 3, shirt_id: 2}.
+# convert_shopping_cart matches the cart's {product_id: quantity} pairs up with their Product database entries (to
+# access the images, descriptions, prices, etc.) for the cart page and for Order database entry once the order is
+# finalized. All the products in the cart are fetched with one query, and the line prices and total are summed in the
+# same pass (see summarize_cart in cart.py).
+# Therefore, a cart with 3 oranges and 2 shirts would be converted into the following:
+# CartSummary(lines=[CartLine(orange, 3, 1.5), CartLine(shirt, 2, 10.0)], total_price=11.5)
+def convert_shopping_cart(shopping_cart):
+    if not shopping_cart:
+        return summarize_cart([], shopping_cart)
+    products = Product.query.filter(Product.id.in_(list(shopping_cart))).order_by(Product.name).all()
+    return summarize_cart(products, shopping_cart)
 
 
 # Home page
-@app.route("/")
+@store.route("/")
 def home():
     # If the user is logged in, the user is passed to the front page for a specific greeting to the user.
     if current_user.is_authenticated:
-        user = User.query.get(current_user.get_id())
+        user = current_user
     # Otherwise, the user who is not logged in will have the Login / Register / Shop direct links available.
     else:
         user = None
-    # Query for all the items in the database.
-    items = Product.query.all()
-    # We will create a list of 8 random items from the above query to be placed in the "Featured Items" carousel.
-    featured_items_list = []
-    while len(featured_items_list) < 9:
-        random_item = random.choice(items)
-        # This ensures we do not add the same item twice into the list if it was already appended.
-        if random_item not in featured_items_list:
-            featured_items_list.append(random_item)
-    # We also want to feature the categories on our home page.
-    # We will generate two lists for the categories and the category_titles as both need to be used for the home page.
-    categories_list = []
-    category_titles_list = []
-    for item in items:
-        if item.category not in categories_list:
-            categories_list.append(item.category)
-            category_titles_list.append(item.category_title)
-    return render_template("index.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                           copyright_year=copyright_year, featured_items=featured_items_list,
-                           categories=categories_list, categories_titles=category_titles_list, user=user)
+    # The featured items for the "Featured Items" carousel only change once per FEATURED_ITEMS_WINDOW (see
+    # featured.py), so the home page is cached for that window like the other catalog pages. One copy is cached for
+    # visitors and one for logged in users, and a logged in user's greeting (home_greeting.html) is put into it for
+    # each request, the same way as the navbar.
+    # We also want to feature the categories on our home page. The catalog keeps a list of (category, category_title)
+    # pairs as both need to be used for the home page.
+    window = featured_items.current_window()
+    key = ("home", window, product_catalog.version, current_year(), user is not None)
+    greeting = {HOME_GREETING_PLACEHOLDER: render_template("home_greeting.html", user=user).encode()} if user else None
+    return render_shared_page(page_cache, key, "index.html",
+                              dict(logged_in=current_user.is_authenticated, cart_size=get_cart().size),
+                              fragments=greeting, logged_in=current_user.is_authenticated,
+                              featured_items=featured_items.items(window), categories=product_catalog.categories())
+
+
+# Adds the product from the clicked add button to the cart. The add button's value is the product id. Anything that
+# isn't the id of an existing product is ignored.
+def add_to_cart_from_form():
+    product_id = request.form.get('add_button', type=int)
+    if product_catalog.get(product_id):
+        try:
+            get_cart().add(product_id)
+        except QuantityTooLarge as error:
+            flash(str(error))
 
 
 # Routes for shopping by all_items, by product category, or individually
-@app.route("/all", methods=["GET", "POST"])
+@store.route("/all", methods=["GET", "POST"])
 def all_items():
-    items = Product.query.all()
-    # We generate a list for each of categories and the titles as we will pass the categories for URL generation and
-    # also need the titles for headers of each category.
-    categories = []
-    category_titles = []
-    for item in items:
-        # Because multiple items will belong to a single category, we need these if statements to ensure only one
-        # category will be appended to the lists.
-        if item.category_title not in category_titles:
-            category_titles.append(item.category_title)
-        if item.category not in categories:
-            categories.append(item.category)
     # Adds item to cart after clicking add
     if request.method == "POST":
-        item = request.form.get('add_button')
-        shopping_cart.append(item)
-        return render_template("all_items.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                               title="All Items", copyright_year=copyright_year, shopping_items=items,
-                               categories=sorted(categories), category_titles=sorted(category_titles))
-    return render_template("all_items.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                           title="All Items", copyright_year=copyright_year, shopping_items=items,
-                           categories=sorted(categories), category_titles=sorted(category_titles))
+        add_to_cart_from_form()
+    # We pass the (category, category_title) pairs as we need the categories for URL generation and also the titles
+    # for headers of each category, and the products of each category to list under each header.
+    return render_catalog_page("all_items.html", title="All Items", categories=product_catalog.categories(),
+                               products=product_catalog.in_category)
 
 
-@app.route("/products/<string:category>", methods=["GET", "POST"])
+@store.route("/products/<string:category>", methods=["GET", "POST"])
 def products(category):
     # Dynamic page that will display items based on category. Items added to cart after clicking add.
-    products_list = Product.query.filter_by(category=category)
+    products_list = product_catalog.in_category(category)
+    if not products_list:
+        return abort(404)
     if request.method == "POST":
-        item = request.form.get('add_button')
-        shopping_cart.append(item)
-        return render_template("products_by_category.html", logged_in=current_user.is_authenticated,
-                               cart_size=len(shopping_cart), title=products_list[0].category_title,
-                               copyright_year=copyright_year, products=products_list)
-    return render_template("products_by_category.html", logged_in=current_user.is_authenticated,
-                           cart_size=len(shopping_cart), title=products_list[0].category_title,
-                           copyright_year=copyright_year, products=products_list)
+        add_to_cart_from_form()
+    return render_catalog_page("products_by_category.html", title=products_list[0].category_title,
+                               products=products_list)
 
 
-@app.route("/products/<string:category>/<string:item>", methods=["GET", "POST"])
+@store.route("/products/<string:category>/<string:item>", methods=["GET", "POST"])
 # We do not assign variable category to anything, it's passed to construct the URL so the category appears before the
 # specific item (ie: /products/fruits_and_vegetables/apple).
 def individual_product(category, item):
     # Dynamic page that will display the specific product with its price, image, and description. Items are added to
     # cart after clicking add
-    specific_product = Product.query.filter_by(name=item).first()
+    specific_product = product_catalog.get_by_name(item)
+    if not specific_product:
+        return abort(404)
+    if request.method == "POST":
+        add_to_cart_from_form()
+    return render_catalog_page("products_individual.html", title=specific_product.name.title(),
+                               product=specific_product)
+
+
+# Routes for searching the products (see search.py). Both take the same query string:
+# q - words to search for in product names and descriptions, the last letters of a word can be left off (ie: "app")
+# category - only products in this category
+# min_price / max_price - only products within this price range
+# sort - one of SEARCH_SORTS (relevance, price_low, price_high, name)
+# page / per_page - which page of results to return and how many results per page
+# ie: /search?q=fresh&category=fruits_and_vegetables&max_price=1&sort=price_low
+SEARCH_ARGS = ["q", "category", "min_price", "max_price", "sort", "per_page"]
+
+
+def search_from_args():
+    sort = request.args.get("sort", "relevance")
+    return search_index.search(
+        query=request.args.get("q", ""),
+        category=request.args.get("category") or None,
+        min_price=request.args.get("min_price", type=float),
+        max_price=request.args.get("max_price", type=float),
+        sort=sort if sort in SEARCH_SORTS else "relevance",
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", SEARCH_RESULTS_PER_PAGE, type=int),
+    )
+
+
+@store.route("/search", methods=["GET", "POST"])
+def search():
     if request.method == "POST":
-        item = request.form.get('add_button')
-        shopping_cart.append(item)
-        return render_template("products_individual.html", logged_in=current_user.is_authenticated,
-                               cart_size=len(shopping_cart), title=specific_product.name.title(),
-                               copyright_year=copyright_year, product=specific_product)
-    return render_template("products_individual.html", logged_in=current_user.is_authenticated,
-                           cart_size=len(shopping_cart), title=specific_product.name.title(),
-                           copyright_year=copyright_year, product=specific_product)
+        add_to_cart_from_form()
+    results = search_from_args()
+    # The previous and next page links keep the rest of the search the same. Only the search's own arguments are
+    # passed on to url_for, since other names (ie: endpoint or _external) would change how the link is built.
+    search_args = {name: request.args[name] for name in SEARCH_ARGS if request.args.get(name)}
+    return render_template("search.html", logged_in=current_user.is_authenticated, cart_size=get_cart().size,
+                           title="Search", results=results, categories=product_catalog.categories(),
+                           sorts=SEARCH_SORTS, search_args=search_args)
+
+
+@store.route("/api/search")
+def api_search():
+    results = search_from_args()
+    return jsonify(
+        total=results.total, page=results.page, per_page=results.per_page,
+        results=[dict(product._asdict(), url=url_for("store.individual_product", category=product.category,
+                                                     item=product.name)) for product in results.products],
+    )
 
 
 # --- Route for login, register, account edit and logout --- #
-@app.route("/login", methods=["GET", "POST"])
+@store.route("/login", methods=["GET", "POST"])
 def login():
     login_form = LoginForm()
     if login_form.validate_on_submit():
@@ -248,202 +249,366 @@ def login():
         user = User.query.filter_by(email=email).first()
         # Errors will show if the email does not exist in our User database or if the password doesn't match with that
         # email.
+        # Passwords are checked by the password_hasher's thread pool (see passwords.py). If too many logins are already
+        # waiting for it, the user is asked to try again rather than holding up the server.
         if not user:
             flash("Email does not exist.")
-        elif not check_password_hash(user.password, password):
-            flash("Password does not match this email.")
-        # Upon successful login, user is redirected to the home page.
         else:
-            login_user(user)
-            return redirect(url_for("home"))
-    return render_template("login.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                           title="Log In", copyright_year=copyright_year, form=login_form)
+            try:
+                password_matches = password_hasher.verify(user.password, password)
+            except PasswordHasherBusy:
+                flash("We're experiencing a high volume of logins. Please try again.")
+                password_matches = None
+            if password_matches is False:
+                flash("Password does not match this email.")
+            # Upon successful login, user is redirected to the home page. If the password was hashed with older
+            # settings (ie: fewer iterations), it is hashed again with the current settings now that we have it.
+            elif password_matches:
+                if password_hasher.needs_rehash(user.password):
+                    try:
+                        user.password = password_hasher.hash(password)
+                        db.session.commit()
+                    except PasswordHasherBusy:
+                        pass
+                login_user(user)
+                return redirect(url_for("store.home"))
+    return render_template("login.html", logged_in=current_user.is_authenticated, cart_size=get_cart().size,
+                           title="Log In", form=login_form)
 
 
-@app.route("/register", methods=["GET", "POST"])
+@store.route("/register", methods=["GET", "POST"])
 def register():
     register_form = RegistrationForm()
     if register_form.validate_on_submit():
         # Checks if the user_email is already affiliated with an account. If so, redirects to login window.
         if User.query.filter_by(email=register_form.email.data).first():
             flash("An existing account already contains this Email. Please Login.")
-            return redirect(url_for('login'))
+            return redirect(url_for('store.login'))
         # Adds the new user to the user database
         else:
+            try:
+                password_hash = password_hasher.hash(register_form.password.data)
+            except PasswordHasherBusy:
+                flash("We're experiencing a high volume of registrations. Please try again.")
+                return render_template("register.html", logged_in=current_user.is_authenticated,
+                                       cart_size=get_cart().size, title="Register", form=register_form)
             new_user = User(
                 name=register_form.name.data,
                 email=register_form.email.data,
-                password=generate_password_hash(register_form.password.data, method='pbkdf2:sha256', salt_length=8)
+                password=password_hash
             )
             db.session.add(new_user)
             db.session.commit()
             # Immediately logs the user in after registration
             login_user(new_user)
-            return redirect(url_for("home"))
-    return render_template("register.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                           title="Register", copyright_year=copyright_year, form=register_form)
+            return redirect(url_for("store.home"))
+    return render_template("register.html", logged_in=current_user.is_authenticated, cart_size=get_cart().size,
+                           title="Register", form=register_form)
 
 
-@app.route("/edit_account/<int:user_id>", methods=["GET", "POST"])
+@store.route("/edit_account/<int:user_id>", methods=["GET", "POST"])
 def edit_account(user_id):
     # Prevents users other than the logged in user from accessing the account when searching directly by URL
     # ie: if the logged in user is user_id = 2, they can not access user_id = 1's account by searching /edit_account/1
     if current_user.id != user_id:
         return abort(403)
     else:
-        user = User.query.filter_by(id=user_id).first()
+        user = current_user
         edit_form = EditForm(name=user.name, email=user.email)
         # Allows users to change their name and/or email. I did not allow password simply because I'll be allowing
         # access to my account to people visiting the site.
         if edit_form.validate_on_submit():
-            user = User.query.filter_by(id=user_id).first()
+            # current_user may come from the user cache, so the user is queried from the database to be changed.
+            # Committing the change also drops the user from the cache.
+            user = User.query.get(user_id)
             user.name = edit_form.name.data
             user.email = edit_form.email.data
             db.session.commit()
-            return redirect(url_for('account', user_id=user.id))
+            return redirect(url_for('store.account', user_id=user.id))
         return render_template("edit_account.html", user=user, logged_in=current_user.is_authenticated,
-                               cart_size=len(shopping_cart), title="Edit Account",
-                               copyright_year=copyright_year, form=edit_form)
+                               cart_size=get_cart().size, title="Edit Account", form=edit_form)
 
 
-@app.route("/logout")
+@store.route("/logout")
 # User logs out when they click Logout in the Navbar
 def logout():
     logout_user()
-    return redirect(url_for("home"))
+    return redirect(url_for("store.home"))
 
 
-@app.route("/account/<int:user_id>")
+@store.route("/account/<int:user_id>")
 def account(user_id):
     # 403 error if a user is trying to access an account directly by the URL that is not the logged in account.
     if current_user.id != user_id:
         return abort(403)
     else:
-        # Accesses all the orders completed by the logged in user from the database.
-        user = User.query.filter_by(id=user_id).first()
-        orders = Order.query.filter_by(user_id=user_id).all()
-
-        # In our SQL Order database, all variables were passed as single strings separated by a comma.
-        # Therefore, when we query for all our orders, we will need to iterate through each order, and separate out
-        # the items, their quantities, the order number, and the final price. Each of these will be added to their own
-        # respective lists, and we will iterate through each list at a specific index on the account.html page to list
-        # the orders.
-        # ie: if we have two orders:
-        # Order 1: 2 apple and 1 orange,total price of 1.5
-        # Order 2: 2 broccoli and 3 carrots, total price 1.75
-        # They will be appended to each list as follow:
-        # item_list = [[apple, orange], [broccoli, carrots]]
-        # quantities_list = [[2, 1], [2, 3]]
-        # total_prices = [1.5, 1.75]
-        # order_id_list = [1, 2]
-        # Therefore, all items at index 0 for each list corresponds to order 1, etc.
-        item_list = []
-        quantities_list = []
-        total_prices = []
-        order_id_list = []
-        for order in orders:
-            # We split by ',' and then remove the last item since it will be an empty string since the last item in each
-            # list is always the comma.
-            items = order.items.split(",")
-            items.remove(items[-1])
-            item_list.append(items)
-            quantities = order.quantity.split(",")
-            quantities.remove(quantities[-1])
-            quantities_list.append(quantities)
-            total_prices.append(order.total_price)
-            order_id_list.append(order.id)
-        # We reverse each list so when we display the previous orders, we start with the most previous order at the top
-        # of the page.
-        item_list.reverse()
-        quantities_list.reverse()
-        total_prices.reverse()
-        order_id_list.reverse()
-        list_iterations = len(item_list)
-        return render_template("account.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                               title=user.name.title(), copyright_year=copyright_year, user=user, items=item_list,
-                               quantities=quantities_list, total_prices=total_prices, id=order_id_list,
-                               iterations=list_iterations)
+        # Accesses the orders completed by the logged in user from the database, newest first so the most recent order
+        # is at the top of the page, ORDERS_PER_PAGE orders at a time. Older pages are requested with
+        # ?before=<order_id>, which returns the orders older than that order. Because the page is found through the
+        # (user_id, id) index rather than by counting past earlier pages, every page costs the same no matter how many
+        # orders the user has.
+        user = current_user
+        before = request.args.get("before", type=int)
+        orders_query = Order.query.filter(Order.user_id == user_id)
+        if before is not None:
+            orders_query = orders_query.filter(Order.id < before)
+        # One extra order is fetched only to tell whether an older page exists. The page's items (and their products)
+        # are loaded in the same query.
+        orders = orders_query.order_by(Order.id.desc()).limit(ORDERS_PER_PAGE + 1) \
+            .options(db.joinedload(Order.items)).all()
+        older_orders = len(orders) > ORDERS_PER_PAGE
+        orders = orders[:ORDERS_PER_PAGE]
+        return render_template("account.html", logged_in=current_user.is_authenticated, cart_size=get_cart().size,
+                               title=user.name.title(), user=user, orders=orders, newer_orders=before is not None,
+                               older_orders_before=orders[-1].id if older_orders else None)
 
 
 # Route for cart
-@app.route("/cart", methods=["GET", "POST"])
+@store.route("/cart", methods=["GET", "POST"])
 def cart():
     # Only a logged-in user can access their cart, otherwise we redirect them to the login page first.
     if current_user.is_authenticated:
+        shopping_cart = get_cart()
         if request.method == "POST":
             # The following is when a user types in a new quantity into the quantity field and updates their cart.
             if request.form.get('update_button'):
-                # Once the update_button is clicked, we query for that item and get the new quantity.
-                item = Product.query.filter_by(name=request.form.get('update_button')).first()
-                quantity = request.form.get(item.name + '_quantity')
-                # The following is based on the convert_shopping_cart logic. If 5 shirts exist in shopping_cart,
-                # they exist as 5 separate string entries (ie: [shirt, shirt, shirt, shirt, shirt]. Therefore,
-                # if we change our quantity from 5 to 2, we will first iterate through the shopping_cart to remove all
-                # 5 shirts from the shopping_cart list, and then append 2 new shirts.
-                if item.name in shopping_cart:
+                # Once the update_button is clicked, we get the product id of the item and its new quantity.
+                # The cart stores each item once with its quantity, so changing 5 shirts to 2 shirts just sets the
+                # quantity to 2. A quantity of 0 removes the item from the cart.
+                product_id = request.form.get('update_button', type=int)
+                quantity = request.form.get(f'{product_id}_quantity', type=int)
+                if product_id is not None and quantity is not None:
                     try:
-                        while True:
-                            shopping_cart.remove(item.name)
-                    except ValueError:
-                        pass
-                # If the new quantity is 0, we will remove the items with the above script, and then not append any new
-                # items. However, if the updated quantity is non-0, we will append that item in the quantity number of
-                # times to the shopping cart.
-                if quantity == 0:
-                    pass
-                else:
-                    for x in range(0, int(quantity)):
-                        shopping_cart.append(item.name)
-            # The following is for when the user clicks the place_order button to finalize their order.
+                        shopping_cart.update(product_id, quantity)
+                    except QuantityTooLarge as error:
+                        flash(str(error))
+            # The following is for when the user clicks the place_order button to finalize their order. The order is
+            # placed with the checkout_key from the cart page's form (see checkout.py), so clicking the button twice or
+            # re-sending the form shows the order that was already placed instead of placing a new one.
             else:
-                # The final_shopping_cart, quantity_list, and total_price are all finalized for database entry
-                # once the order is finalized.
-                final_shopping_cart, quantity_list = convert_shopping_cart(shopping_cart)
-                total_price = total_price_calculator(final_shopping_cart, quantity_list)
-                # Entries in the quantity_list are turned into strings for database entry.
-                quantity_list = [str(quantity_item) for quantity_item in quantity_list]
-
-                # Because our database will only accept strings, we have to concatenate all the items and quantities
-                # into a single string. We separate each entry with a comma for simple separating when we need access
-                # to previous orders for the user's account page.
-                item_database_entry = ""
-                quantity_database_entry = ""
-                for item in final_shopping_cart:
-                    item_database_entry += item.name + ","
-                for entry in quantity_list:
-                    quantity_database_entry += entry + ","
-                new_order = Order(
-                    items=item_database_entry,
-                    quantity=quantity_database_entry,
-                    total_price=total_price,
-                    user_id=current_user.id
-                )
-                db.session.add(new_order)
-                db.session.commit()
-                # After the order is complete, we delete the items in the shopping_cart to return it to empty.
-                # We used a while loop because the shopping_cart would sometimes bug and not remove some items near the
-                # end of its list. The while loop ensures all items are deleted.
-                while shopping_cart:
-                    for item in shopping_cart:
-                        try:
-                            shopping_cart.remove(item)
-                        except ValueError:
-                            pass
-                return render_template("order_complete.html", logged_in=current_user.is_authenticated,
-                                       cart_size=len(shopping_cart), title=f"Order #{new_order.id} Complete!",
-                                       copyright_year=copyright_year, order_num=new_order.id, user=current_user)
+                checkout_key = request.headers.get("Idempotency-Key") or request.form.get("checkout_key")
+                try:
+                    new_order, placed = place_order(current_user.id, shopping_cart.items(), checkout_key)
+                except OutOfStock as error:
+                    for product, stock in error.products:
+                        flash(f"Sorry, only {stock} {product.name.title()} left." if stock else
+                              f"Sorry, {product.name.title()} is out of stock.")
+                    new_order, placed = None, False
+                except InvalidIdempotencyKey:
+                    return abort(400)
+                # After the order is complete, we empty the cart. When the order was already placed with this key (ie:
+                # the button was clicked twice and the first response never reached the browser, or the form was sent
+                # again from an old cart page), only that order's items are taken out of the cart, so they aren't
+                # ordered again while anything added since stays in it.
+                if placed:
+                    shopping_cart.clear()
+                elif new_order is not None:
+                    for item in new_order.items:
+                        shopping_cart.update(item.product_id, shopping_cart.quantity(item.product_id) - item.quantity)
+                if new_order is not None:
+                    return render_template("order_complete.html", logged_in=current_user.is_authenticated,
+                                           cart_size=shopping_cart.size, title=f"Order #{new_order.id} Complete!",
+                                           order_num=new_order.id, user=current_user)
 
         # This displays the cart page with all the items currently in the cart
-        final_shopping_cart, quantity_list = convert_shopping_cart(shopping_cart)
-        total_price = total_price_calculator(final_shopping_cart, quantity_list)
+        cart_summary = convert_shopping_cart(shopping_cart.items())
 
-        return render_template("cart.html", logged_in=current_user.is_authenticated, cart_size=len(shopping_cart),
-                               title="Cart", copyright_year=copyright_year, cart=final_shopping_cart,
-                               quantity=quantity_list, total_price=total_price)
+        return render_template("cart.html", logged_in=current_user.is_authenticated, cart_size=shopping_cart.size,
+                               title="Cart", cart=cart_summary.lines, total_price=cart_summary.total_price,
+                               checkout_key=uuid.uuid4().hex)
     else:
         flash("Please login in to checkout.")
-        return redirect(url_for('login'))
+        return redirect(url_for('store.login'))
+
+
+# --- JSON cart API --- #
+# Used by static/cart.js so adding an item or changing a quantity only updates the cart link and prices on the page
+# rather than reloading it. Products are looked up in the product catalog, so these routes don't query the database.
+# POST   /api/cart/items               {"product_id": 3, "quantity": 1} - adds to the item's quantity (1 by default)
+# PATCH  /api/cart/items/<product_id>  {"quantity": 2}                  - sets the item's quantity (0 removes it)
+# DELETE /api/cart/items/<product_id>                                   - removes the item
+# GET    /api/cart                                                      - the whole cart
+# An item can't go over MAX_CART_QUANTITY units (see cart.py). Requests that would are answered with a 400.
+# Requests that change the cart must send JSON. Browsers only let another site send a JSON request after asking this
+# site first, so another site can't change a visitor's cart by posting a form to these routes.
+def cart_api_error(message, status):
+    return jsonify(error=message), status
+
+
+def cart_api_quantity(default=None):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None
+    quantity = data.get("quantity", default)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 0:
+        return None
+    return quantity
+
+
+# The item's new quantity and line total, plus the cart's new size and total price.
+def cart_api_item(shopping_cart, product):
+    cart_summary = summarize_cart(filter(None, map(product_catalog.get, shopping_cart.items())), shopping_cart.items())
+    quantity = shopping_cart.quantity(product.id)
+    return jsonify(size=shopping_cart.size, total_price=cart_summary.total_price, product_id=product.id,
+                   quantity=quantity, line_total=product.price * quantity)
+
+
+@store.route("/api/cart")
+def api_cart():
+    shopping_cart = get_cart()
+    products = sorted(filter(None, map(product_catalog.get, shopping_cart.items())), key=lambda product: product.name)
+    cart_summary = summarize_cart(products, shopping_cart.items())
+    return jsonify(size=shopping_cart.size, total_price=cart_summary.total_price, items=[
+        dict(product_id=line.product.id, name=line.product.name, price=line.product.price, quantity=line.quantity,
+             line_total=line.line_total) for line in cart_summary.lines
+    ])
+
+
+@store.route("/api/cart/items", methods=["POST"])
+def api_add_cart_item():
+    data = request.get_json(silent=True)
+    product_id = data.get("product_id") if isinstance(data, dict) else None
+    if isinstance(product_id, bool) or not isinstance(product_id, int):
+        return cart_api_error("product_id must be a whole number.", 400)
+    product = product_catalog.get(product_id)
+    quantity = cart_api_quantity(default=1)
+    if product is None:
+        return cart_api_error("No such product.", 404)
+    if not quantity:
+        return cart_api_error("Quantity must be a whole number above 0.", 400)
+    shopping_cart = get_cart()
+    try:
+        shopping_cart.add(product.id, quantity)
+    except QuantityTooLarge as error:
+        return cart_api_error(str(error), 400)
+    return jsonify(size=shopping_cart.size, product_id=product.id, quantity=shopping_cart.quantity(product.id))
+
+
+@store.route("/api/cart/items/<int:product_id>", methods=["PATCH", "DELETE"])
+def api_cart_item(product_id):
+    product = product_catalog.get(product_id)
+    if product is None:
+        return cart_api_error("No such product.", 404)
+    quantity = 0 if request.method == "DELETE" else cart_api_quantity()
+    if quantity is None:
+        return cart_api_error("Quantity must be a whole number of 0 or more.", 400)
+    shopping_cart = get_cart()
+    try:
+        shopping_cart.update(product.id, quantity)
+    except QuantityTooLarge as error:
+        return cart_api_error(str(error), 400)
+    return cart_api_item(shopping_cart, product)
+
+
+# --- Admin sales reports --- #
+# Sales reports for the users in ADMIN_EMAILS (see config.py), read from the rollup tables kept up to date by
+# analytics.py, so they take the same time however many orders there are.
+# GET /admin/reports?start=2026-01-01&end=2026-01-31&by=product - JSON, by is day (the default), product or category
+# GET /admin/reports.csv?start=2025-01-01&end=2025-12-31       - CSV of every product's units and revenue per day
+# start and end are both included, and default to the REPORT_DAYS days up to today (UTC).
+REPORT_DAYS = 30
+
+
+def require_admin():
+    if not current_user.is_authenticated or current_user.email not in current_app.config["ADMIN_EMAILS"]:
+        abort(403)
+
+
+def report_dates():
+    try:
+        end = datetime.date.fromisoformat(request.args.get("end") or datetime.datetime.utcnow().date().isoformat())
+        start = datetime.date.fromisoformat(request.args.get("start") or
+                                            (end - datetime.timedelta(days=REPORT_DAYS - 1)).isoformat())
+    except ValueError:
+        abort(400)
+    return start, end
+
+
+@store.route("/admin/reports")
+def admin_reports():
+    require_admin()
+    start, end = report_dates()
+    group = request.args.get("by", "day")
+    if group not in REPORT_GROUPS:
+        abort(400)
+    return jsonify(start=start.isoformat(), end=end.isoformat(), by=group, rolled_up_to_order=rolled_up_to(),
+                   rows=sales_report(start, end, group))
+
+
+@store.route("/admin/reports.csv")
+def admin_reports_csv():
+    require_admin()
+    start, end = report_dates()
+
+    # Each row is written out as soon as it is read, so the export starts straight away and uses the same memory for
+    # a year of sales as for a day.
+    def generate_csv():
+        line = io.StringIO()
+        writer = csv.writer(line)
+        for row in itertools.chain([CSV_COLUMNS], sales_rows(start, end)):
+            writer.writerow(row)
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+
+    return Response(stream_with_context(generate_csv()), mimetype="text/csv", headers={
+        "Content-Disposition": f"attachment; filename=sales-{start.isoformat()}-{end.isoformat()}.csv"})
+
+
+# --- App factory --- #
+# Builds the app with one of the configs in config.py (picked with APP_CONFIG by default). Keyword arguments override
+# single settings, ie: create_app(WARM_CACHES=False).
+# gunicorn runs create_app() through the Procfile, and loads it once before forking its workers (see gunicorn.conf.py).
+def create_app(config=None, **settings):
+    boot_start = time.perf_counter()
+    app = Flask(__name__)
+    app.config.from_object(config or get_config())
+    app.config.update(settings)
+    # Compiled templates are saved to disk, so a new worker loads them instead of compiling them again. This has to be
+    # set up before the first template is loaded.
+    template_cache_dir = app.config["TEMPLATE_CACHE_DIR"] or os.path.join(app.instance_path, "template_cache")
+    os.makedirs(template_cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
+    # Enable Bootstrap for WTForms
+    Bootstrap(app)
+    # Records SQL, template rendering, and total time for every request (see metrics.py).
+    init_metrics(app)
+    # Enable SQL Database. Connection pooling and SQLite settings are in database.py, and the settings in use are
+    # printed once on startup.
+    db.init_app(app)
+    if app.config["REPORT_DATABASE_SETTINGS"]:
+        report_database_settings(app, db)
+    login_manager.init_app(app)
+    # The product catalog, user cache, page cache, search index and password hasher of this app.
+    init_store(app)
+    app.add_template_global(image_manifest.variants, name="image_variants")
+    app.register_blueprint(store)
+    if app.config["WARM_CACHES"]:
+        warm_caches(app)
+    print(f"App started in {(time.perf_counter() - boot_start) * 1000:.0f}ms", flush=True)
+    return app
+
+
+# Loads everything the first requests would otherwise load on first use (the product catalog, the search index, every
+# template, and the WARM_PATHS pages in the page cache), so the app's first request is as fast as the ones after it.
+def warm_caches(app):
+    start = time.perf_counter()
+    with app.app_context():
+        products = product_catalog.all()
+        search_index.search()
+        # Compiles every template, or loads it from the template cache.
+        templates = [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates(extensions=["html"])]
+        # Rendering the pages also sets up what only the first request would (ie: URL routing, sessions and logins).
+        client = app.test_client()
+        for path in app.config["WARM_PATHS"]:
+            client.get(path)
+        # Database connections can't be shared between processes, so none are left open for gunicorn's workers.
+        db.engine.dispose()
+    # The warm up requests aren't real traffic.
+    request_metrics.reset()
+    print(f"Warmed caches in {(time.perf_counter() - start) * 1000:.0f}ms: {len(products)} products, "
+          f"{len(templates)} templates, pages {', '.join(app.config['WARM_PATHS'])}", flush=True)
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000)
+    create_app().run(host='0.0.0.0', port=5000)
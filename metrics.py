@@ -0,0 +1,143 @@
+from bisect import bisect_left
+import os
+import threading
+import time
+from flask import g, has_request_context, request, Response
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per request performance numbers: how many SQL statements ran and how long they took, how long templates took to
+# render, and the total time of the request.
+# - Every response gets a Server-Timing header with these numbers, so they show up in the browser's developer tools.
+# - Totals per endpoint are served at /metrics in the Prometheus text format. They are kept per worker process.
+# - Requests slower than SLOW_REQUEST_MS (environment variable) are logged along with the SQL statements they ran.
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+# Only the first statements of a request are kept for the slow request log.
+MAX_LOGGED_STATEMENTS = 50
+# Upper bounds (in seconds) of the request duration histogram buckets.
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class EndpointStats:
+
+    def __init__(self):
+        # bucket_counts[i] counts the requests that took at most DURATION_BUCKETS[i], the last slot counts the rest.
+        self.bucket_counts = [0] * (len(DURATION_BUCKETS) + 1)
+        self.requests = 0
+        self.duration = 0.0
+        self.sql_queries = 0
+        self.sql_duration = 0.0
+        self.render_duration = 0.0
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, duration, sql_queries, sql_duration, render_duration):
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            stats.bucket_counts[bisect_left(DURATION_BUCKETS, duration)] += 1
+            stats.requests += 1
+            stats.duration += duration
+            stats.sql_queries += sql_queries
+            stats.sql_duration += sql_duration
+            stats.render_duration += render_duration
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+    def prometheus(self):
+        lines = [
+            "# HELP shop_request_duration_seconds Time taken to handle a request.",
+            "# TYPE shop_request_duration_seconds histogram",
+        ]
+        totals = []
+        with self._lock:
+            for endpoint, stats in sorted(self.endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                cumulative = 0
+                for bucket, count in zip(DURATION_BUCKETS, stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'shop_request_duration_seconds_bucket{{{label},le="{bucket}"}} {cumulative}')
+                lines.append(f'shop_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.requests}')
+                lines.append(f"shop_request_duration_seconds_sum{{{label}}} {stats.duration}")
+                lines.append(f"shop_request_duration_seconds_count{{{label}}} {stats.requests}")
+                totals.append((label, stats.sql_queries, stats.sql_duration, stats.render_duration))
+        lines += ["# HELP shop_sql_queries_total SQL statements run while handling requests.",
+                  "# TYPE shop_sql_queries_total counter"]
+        lines += [f"shop_sql_queries_total{{{label}}} {queries}" for label, queries, _, _ in totals]
+        lines += ["# HELP shop_sql_duration_seconds_total Time spent running SQL statements.",
+                  "# TYPE shop_sql_duration_seconds_total counter"]
+        lines += [f"shop_sql_duration_seconds_total{{{label}}} {duration}" for label, _, duration, _ in totals]
+        lines += ["# HELP shop_render_duration_seconds_total Time spent rendering templates.",
+                  "# TYPE shop_render_duration_seconds_total counter"]
+        lines += [f"shop_render_duration_seconds_total{{{label}}} {duration}" for label, _, _, duration in totals]
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+# Templates are timed by rendering them through this class (set as the app's jinja_env.template_class). Only the page
+# template's render() is timed, the templates it extends or includes are part of that time.
+class TimedTemplate(Template):
+
+    def render(self, *args, **kwargs):
+        if not has_request_context():
+            return super().render(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            g.render_duration = g.get("render_duration", 0.0) + time.perf_counter() - start
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "query_start" in g:
+        duration = time.perf_counter() - g.pop("query_start")
+        g.sql_queries = g.get("sql_queries", 0) + 1
+        g.sql_duration = g.get("sql_duration", 0.0) + duration
+        if g.sql_queries <= MAX_LOGGED_STATEMENTS:
+            g.setdefault("sql_statements", []).append(f"{duration * 1000:.1f}ms {statement}")
+
+
+def init_metrics(app):
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if "request_start" not in g:
+            return response
+        duration = time.perf_counter() - g.request_start
+        sql_queries = g.get("sql_queries", 0)
+        sql_duration = g.get("sql_duration", 0.0)
+        render_duration = g.get("render_duration", 0.0)
+        response.headers["Server-Timing"] = (
+            f'sql;dur={sql_duration * 1000:.1f};desc="{sql_queries} queries", '
+            f"render;dur={render_duration * 1000:.1f}, total;dur={duration * 1000:.1f}")
+        request_metrics.record(request.endpoint or "unknown", duration, sql_queries, sql_duration, render_duration)
+        if duration * 1000 >= SLOW_REQUEST_MS:
+            app.logger.warning("Slow request: %s %s took %.1fms (%d SQL queries, %.1fms SQL, %.1fms rendering)\n%s",
+                               request.method, request.full_path, duration * 1000, sql_queries, sql_duration * 1000,
+                               render_duration * 1000, "\n".join(g.get("sql_statements", [])))
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(request_metrics.prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,142 @@
+# Database migrations for an existing store database (ie: store.db or the DATABASE_URL1 database).
+# Every migration checks whether it has already been applied, so running this script again is safe.
+# Run from the repository root:
+# python migrations.py
+# On Heroku this runs as the release phase (see Procfile) before every deploy starts its web dynos, since the app reads
+# columns added here (ie: products.stock) as soon as it starts.
+from datetime import datetime
+import os
+from sqlalchemy import inspect, text
+from main import create_app
+from models import db, to_cents, Order, OrderItem, order_history_index
+
+
+# Orders used to keep their items and quantities as comma-joined strings (ie: items = "apple,orange,",
+# quantity = "2,1,") and the total price as a string (ie: "1.50"). This moves every order's items into the order_items
+# table and stores the total price in cents.
+# The price of each item at the time of purchase was never stored, so the product's current price is used.
+def order_items_table(connection):
+    if not inspect(connection).has_table("orders"):
+        return False
+    order_columns = [column["name"] for column in inspect(connection).get_columns("orders")]
+    if "items" not in order_columns:
+        return False
+
+    old_orders = connection.execute(text("SELECT id, items, quantity, total_price, user_id FROM orders")).all()
+    products = {name: (product_id, price) for product_id, name, price in
+                connection.execute(text("SELECT id, name, price FROM products"))}
+
+    connection.execute(text("ALTER TABLE orders RENAME TO orders_old"))
+    db.metadata.create_all(connection, tables=[Order.__table__, OrderItem.__table__])
+
+    order_rows = []
+    order_item_rows = []
+    for order_id, items, quantities, total_price, user_id in old_orders:
+        order_rows.append(dict(id=order_id, total_price_cents=to_cents(float(total_price)), user_id=user_id))
+        # Every entry is followed by a comma, so the last entry after splitting is always an empty string.
+        for name, quantity in zip(items.split(",")[:-1], quantities.split(",")[:-1]):
+            if name not in products:
+                print(f"Order #{order_id}: skipping '{name}', it is no longer a product.")
+                continue
+            product_id, price = products[name]
+            order_item_rows.append(dict(order_id=order_id, product_id=product_id, quantity=int(quantity),
+                                        unit_price_cents=to_cents(price)))
+    if order_rows:
+        connection.execute(Order.__table__.insert(), order_rows)
+    if order_item_rows:
+        connection.execute(OrderItem.__table__.insert(), order_item_rows)
+    connection.execute(text("DROP TABLE orders_old"))
+    # Postgres doesn't move the id sequence forward when ids are inserted explicitly.
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT setval(pg_get_serial_sequence('orders', 'id'), "
+                                "COALESCE((SELECT MAX(id) FROM orders), 1))"))
+    print(f"Moved {len(order_rows)} orders with {len(order_item_rows)} items into order_items.")
+    return True
+
+
+# Adds the (user_id, id DESC) index used to page through a user's order history.
+def orders_user_id_index(connection):
+    if not inspect(connection).has_table("orders"):
+        return False
+    if order_history_index.name in [index["name"] for index in inspect(connection).get_indexes("orders")]:
+        return False
+    order_history_index.create(connection)
+    return True
+
+
+# Adds the products.stock column. Products that existed before stock was tracked start with INITIAL_STOCK units
+# (environment variable), so they can still be ordered.
+def product_stock(connection):
+    if not inspect(connection).has_table("products"):
+        return False
+    if "stock" in [column["name"] for column in inspect(connection).get_columns("products")]:
+        return False
+    connection.execute(text("ALTER TABLE products ADD COLUMN stock INTEGER NOT NULL DEFAULT 0"))
+    connection.execute(text("UPDATE products SET stock = :stock"),
+                       dict(stock=int(os.environ.get("INITIAL_STOCK", 100))))
+    return True
+
+
+# Adds the orders.idempotency_key column. Its unique index is created by missing_indexes.
+def order_idempotency_key(connection):
+    if not inspect(connection).has_table("orders"):
+        return False
+    if "idempotency_key" in [column["name"] for column in inspect(connection).get_columns("orders")]:
+        return False
+    connection.execute(text("ALTER TABLE orders ADD COLUMN idempotency_key VARCHAR(64)"))
+    return True
+
+
+# Adds the orders.created_at column. When older orders were placed was never stored, so they are dated to when this
+# migration runs.
+def order_created_at(connection):
+    if not inspect(connection).has_table("orders"):
+        return False
+    if "created_at" in [column["name"] for column in inspect(connection).get_columns("orders")]:
+        return False
+    connection.execute(text("ALTER TABLE orders ADD COLUMN created_at TIMESTAMP"))
+    connection.execute(text("UPDATE orders SET created_at = :now"), dict(now=datetime.utcnow()))
+    return True
+
+
+# Adds any index declared on the models (ie: index=True columns) that doesn't exist in the database yet.
+def missing_indexes(connection):
+    inspector = inspect(connection)
+    created = False
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+                print(f"Created index {index.name}")
+                created = True
+    return created
+
+
+MIGRATIONS = [
+    order_items_table,
+    orders_user_id_index,
+    product_stock,
+    order_idempotency_key,
+    order_created_at,
+    missing_indexes,
+]
+
+
+def migrate():
+    # The caches aren't warmed, they would read tables that haven't been migrated yet.
+    app = create_app(WARM_CACHES=False)
+    with app.app_context():
+        # Each migration runs in its own transaction, so a failed migration leaves the database as it was.
+        for migration in MIGRATIONS:
+            with db.engine.begin() as connection:
+                applied = migration(connection)
+            print(f"{migration.__name__}: {'applied' if applied else 'already up to date'}")
+        # Creates any tables that don't exist yet (ie: on a brand new database).
+        db.create_all()
+
+
+if __name__ == "__main__":
+    migrate()
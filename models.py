@@ -0,0 +1,102 @@
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+
+db = SQLAlchemy()
+
+
+# Database models
+class User(UserMixin, db.Model):
+    __tablename__ = "users"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(250), nullable=False, unique=True)
+    password = db.Column(db.String(250), nullable=False)
+    orders = db.relationship("Order", backref="user", lazy=True)
+
+
+class Product(db.Model):
+    __tablename__ = "products"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    # category is what is used to pass as a variable. category_title is used as the text on webpages.
+    # For example for fruits and vegetables:
+    # category = fruits_and_vegetables
+    # category_title = Fruits & Vegetables
+    category = db.Column(db.String(100), nullable=False, index=True)
+    category_title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    img = db.Column(db.String(100), nullable=False)
+    # Units left to sell. Checkout takes the ordered units off in the same transaction as the order (see checkout.py).
+    stock = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+
+# Prices are stored on orders as a whole number of cents so totals add up exactly, ie: $12.50 is stored as 1250.
+def to_cents(price):
+    return int(round(price * 100))
+
+
+class Order(db.Model):
+    __tablename__ = "orders"
+    id = db.Column(db.Integer, primary_key=True)
+    total_price_cents = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The key the order was placed with, so placing it again returns this order rather than a new one (see checkout.py).
+    idempotency_key = db.Column(db.String(64))
+    # When the order was placed, in UTC.
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    items = db.relationship("OrderItem", backref="order", lazy=True, order_by="OrderItem.id")
+
+    @property
+    def total_price(self):
+        return self.total_price_cents / 100
+
+
+# The account page lists a user's orders newest first, one page at a time (see account in main.py). This index lets the
+# database jump straight to the requested page instead of scanning and sorting every order.
+order_history_index = db.Index("ix_orders_user_id_id", Order.user_id, Order.id.desc())
+# A user can only place one order with each idempotency key. Orders without a key (NULL) are not affected.
+order_idempotency_index = db.Index("ix_orders_user_id_idempotency_key", Order.user_id, Order.idempotency_key,
+                                   unique=True)
+
+
+# Each item in an order gets its own row with its quantity and the price of a single unit at the time of purchase,
+# so later price changes don't change the totals of previous orders.
+class OrderItem(db.Model):
+    __tablename__ = "order_items"
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price_cents = db.Column(db.Integer, nullable=False)
+    product = db.relationship("Product", lazy="joined")
+
+    @property
+    def line_total(self):
+        return self.unit_price_cents * self.quantity / 100
+
+
+# Sales rollups for the admin reports, kept up to date from new orders by analytics.py. Each row adds up the items sold
+# on one day (UTC), so a report over any date range reads a few rows per day no matter how many orders there are.
+class ProductDailySales(db.Model):
+    __tablename__ = "product_daily_sales"
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    units = db.Column(db.Integer, nullable=False)
+    revenue_cents = db.Column(db.Integer, nullable=False)
+
+
+class CategoryDailySales(db.Model):
+    __tablename__ = "category_daily_sales"
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(100), primary_key=True)
+    units = db.Column(db.Integer, nullable=False)
+    revenue_cents = db.Column(db.Integer, nullable=False)
+
+
+# How far each rollup has got, ie: name = "orders", last_order_id = 1200 means every order up to #1200 is counted.
+class RollupState(db.Model):
+    __tablename__ = "rollup_state"
+    name = db.Column(db.String(50), primary_key=True)
+    last_order_id = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Password hashing is deliberately slow (ie: pbkdf2:sha256 with 260,000 iterations takes ~0.1-0.3s of CPU), so it is
+# run in a small, fixed size pool of threads rather than directly in the request. The hashing functions release the
+# GIL, so the pool hashes in parallel while limiting how many CPU cores hashing can take up at once, and a burst of
+# logins waits for a free thread instead of starving every other route.
+# A request still waits for its own hash, so this only keeps other routes responsive when each worker can serve more
+# than one request at a time (gunicorn.conf.py runs threaded workers for this). In a single threaded worker the pool
+# only caps how much CPU hashing takes up.
+#
+# Settings (environment variables):
+# PASSWORD_HASH_METHOD  - any method accepted by werkzeug's generate_password_hash, ie: pbkdf2:sha256:600000
+# PASSWORD_SALT_LENGTH  - number of characters of salt
+# PASSWORD_HASH_WORKERS - number of passwords that can be hashed at the same time
+# PASSWORD_HASH_QUEUE   - number of requests that can wait for a free thread before new ones are turned away
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 16))
+
+
+# Raised when too many passwords are already waiting to be hashed.
+class PasswordHasherBusy(Exception):
+    pass
+
+
+# The method part of the hashes generate_password_hash makes with method, worked out without hashing anything (a hash
+# takes as long as a login). werkzeug stores pbkdf2 hashes with their iteration count, filling in its default count
+# when the method doesn't give one, ie: "pbkdf2:sha256" is stored as "pbkdf2:sha256:260000".
+def stored_method(method):
+    if method.startswith("pbkdf2:") and len(method.split(":")) == 2:
+        return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+class PasswordHasher:
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH, workers=PASSWORD_HASH_WORKERS,
+                 queue=PASSWORD_HASH_QUEUE, timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        # Hashes running plus hashes waiting for a thread.
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        # A stored hash looks like "method$salt$hash". This is the method part that the current settings produce,
+        # ie: "pbkdf2:sha256:260000", used to spot passwords that were hashed with older settings.
+        self._current_method = stored_method(method)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            return self._pool.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # True if the password was hashed with a different method/cost or a shorter salt than the current settings.
+        method, _, rest = password_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self._current_method or len(salt) < self.salt_length
@@ -0,0 +1,81 @@
+from collections import OrderedDict, namedtuple
+import hashlib
+import threading
+from flask import render_template, make_response, request
+
+# The catalog pages (all items, a category, a single product) are the same for every visitor except for the right hand
+# side of the navbar (Log In / Account and the cart size). Those pages are rendered once with a placeholder in place of
+# that part of the navbar (see base.html), cached, and the small per-user navbar fragment (navbar_user.html) is put
+# into the cached page for each request. This way one cached copy of a page can be shared by all users.
+NAVBAR_USER_PLACEHOLDER = b"<!-- navbar-user -->"
+# Other per-user parts of a cached page (ie: the greeting on the home page) use their own placeholders, see
+# render_shared_page's fragments.
+HOME_GREETING_PLACEHOLDER = b"<!-- home-greeting -->"
+# Rendered pages are kept up to this many bytes in total, the least recently used pages are dropped first.
+RESPONSE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# body is the rendered page (with the placeholder) encoded as bytes and etag is a hash of it.
+CachedPage = namedtuple("CachedPage", ["body", "etag"])
+
+
+class ResponseCache:
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def set(self, key, body):
+        page = CachedPage(body, hashlib.sha1(body).hexdigest()[:16])
+        # Pages larger than the whole budget are never cached.
+        if len(body) > self.max_bytes:
+            return page
+        with self._lock:
+            if key in self._pages:
+                self.size -= len(self._pages.pop(key).body)
+            self._pages[key] = page
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self.size -= len(self._pages.popitem(last=False)[1].body)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+
+# Renders (or fetches from cache) a page that is shared by all users, then adds the current user's navbar fragment.
+# key must include everything other than the user that the page depends on. navbar_context is passed to
+# navbar_user.html (ie: logged_in and cart_size). fragments is {placeholder: rendered bytes} for any other per-user
+# parts of the page.
+# GET requests get an ETag, and a 304 Not Modified response if the browser already has this exact page.
+def render_shared_page(cache, key, template_name, navbar_context, fragments=None, **context):
+    page = cache.get(key)
+    if page is None:
+        body = render_template(template_name, navbar_user_placeholder=True, **context).encode()
+        page = cache.set(key, body)
+    navbar_user = render_template("navbar_user.html", **navbar_context).encode()
+    body = page.body.replace(NAVBAR_USER_PLACEHOLDER, navbar_user, 1)
+    user_parts = hashlib.sha1(navbar_user)
+    for placeholder, fragment in (fragments or {}).items():
+        body = body.replace(placeholder, fragment, 1)
+        user_parts.update(fragment)
+    response = make_response(body)
+    # The response differs per user only by the per-user fragments, so the ETag combines the page and fragment hashes.
+    response.set_etag(f"{page.etag}-{user_parts.hexdigest()[:8]}")
+    response.headers["Cache-Control"] = "private, no-cache"
+    if request.method == "GET":
+        response.make_conditional(request)
+    return response
@@ -0,0 +1,135 @@
+from bisect import bisect_left, insort
+from collections import namedtuple
+import re
+import threading
+
+# Product search, backed by an inverted index held in memory by each worker: every word that appears in a product's
+# name or description maps to the ids of the products containing it, ie:
+# {"apple": {1}, "fresh": {1, 2, 3}, ...}
+# A search word matches every indexed word that starts with it (so "app" finds "apple"), and a product has to match
+# every word of the search to be a result. Matches in the name count more towards the relevance than matches in the
+# description.
+# The index is kept in sync with the product catalog (see catalog.py): when the catalog changes, only the products that
+# were added, changed or removed are re-indexed.
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+SEARCH_RESULTS_PER_PAGE = 24
+SEARCH_MAX_RESULTS_PER_PAGE = 100
+SEARCH_SORTS = ["relevance", "price_low", "price_high", "name"]
+
+SearchResults = namedtuple("SearchResults", ["products", "total", "page", "per_page"])
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class SearchIndex:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._version = None
+        # {product id: product} of the products currently in the index.
+        self._products = {}
+        # {word: {product id: weight}}
+        self._postings = {}
+        # All indexed words in alphabetical order, to find the words starting with a prefix.
+        self._words = []
+
+    def _product_weights(self, product):
+        weights = {}
+        for word in tokenize(product.name):
+            weights[word] = weights.get(word, 0) + NAME_WEIGHT
+        for word in tokenize(product.description):
+            weights[word] = weights.get(word, 0) + DESCRIPTION_WEIGHT
+        return weights
+
+    def _add(self, product):
+        self._products[product.id] = product
+        for word, weight in self._product_weights(product).items():
+            if word not in self._postings:
+                self._postings[word] = {}
+                insort(self._words, word)
+            self._postings[word][product.id] = weight
+
+    def _remove(self, product):
+        del self._products[product.id]
+        for word in self._product_weights(product):
+            postings = self._postings[word]
+            postings.pop(product.id, None)
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def _sync(self):
+        # Must be called with the lock held.
+        version = self.catalog.version
+        if version == self._version:
+            return
+        products = {product.id: product for product in self.catalog.all()}
+        for product_id, product in list(self._products.items()):
+            if products.get(product_id) != product:
+                self._remove(product)
+        for product_id, product in products.items():
+            if product_id not in self._products:
+                self._add(product)
+        self._version = version
+
+    def _matching_words(self, prefix):
+        start = bisect_left(self._words, prefix)
+        end = start
+        while end < len(self._words) and self._words[end].startswith(prefix):
+            end += 1
+        return self._words[start:end]
+
+    def _score(self, query_words):
+        # {product id: relevance} of the products matching every query word.
+        scores = None
+        for query_word in query_words:
+            word_scores = {}
+            for word in self._matching_words(query_word):
+                for product_id, weight in self._postings[word].items():
+                    word_scores[product_id] = word_scores.get(product_id, 0) + weight
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {product_id: score + word_scores[product_id] for product_id, score in scores.items()
+                          if product_id in word_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, query="", category=None, min_price=None, max_price=None, sort="relevance", page=1,
+               per_page=SEARCH_RESULTS_PER_PAGE):
+        with self._lock:
+            self._sync()
+            query_words = tokenize(query)
+            if query_words:
+                scores = self._score(query_words)
+                products = [self._products[product_id] for product_id in scores]
+            else:
+                # An empty search lists every product (ie: to browse a category by price).
+                scores = {}
+                products = list(self._products.values())
+
+        if category:
+            products = [product for product in products if product.category == category]
+        if min_price is not None:
+            products = [product for product in products if product.price >= min_price]
+        if max_price is not None:
+            products = [product for product in products if product.price <= max_price]
+
+        if sort == "price_low":
+            products.sort(key=lambda product: (product.price, product.name))
+        elif sort == "price_high":
+            products.sort(key=lambda product: (-product.price, product.name))
+        elif sort == "name" or not scores:
+            products.sort(key=lambda product: product.name)
+        else:
+            products.sort(key=lambda product: (-scores[product.id], product.name))
+
+        per_page = max(1, min(per_page, SEARCH_MAX_RESULTS_PER_PAGE))
+        page = max(1, page)
+        start = (page - 1) * per_page
+        return SearchResults(products[start:start + per_page], len(products), page, per_page)
@@ -0,0 +1,98 @@
+// Adds items to the cart and updates cart quantities through the JSON cart API (see /api/cart in main.py) so the page
+// doesn't have to reload. Only the cart link in the navbar and the prices on the cart page are updated.
+// If a request fails (or JavaScript is disabled), the buttons submit their forms as they did before.
+
+function formatPrice(price) {
+    return "$" + price.toFixed(2);
+}
+
+function updateCartLink(size) {
+    const cartLink = document.getElementById("cart-link");
+    if (cartLink) {
+        cartLink.textContent = size ? `Cart(${size})` : "Cart";
+    }
+}
+
+async function sendCartRequest(method, url, body) {
+    const response = await fetch(url, {
+        method: method,
+        headers: {"Content-Type": "application/json", "Accept": "application/json"},
+        body: body === undefined ? undefined : JSON.stringify(body),
+        credentials: "same-origin",
+    });
+    if (!response.ok) {
+        throw new Error(`${method} ${url} failed with ${response.status}`);
+    }
+    return response.json();
+}
+
+// The cart is kept in the session cookie, so two cart requests sent at once would both start from the same cart and the
+// second response would undo the first (ie: a double-clicked "Add" would only add one item). Cart requests are queued
+// instead, each one is only sent once the one before it has finished.
+let cartQueue = Promise.resolve();
+
+function queueCartRequest(task) {
+    const result = cartQueue.then(task);
+    cartQueue = result.catch(() => {});
+    return result;
+}
+
+// Falls back to submitting the button's form the normal way.
+function submitForm(button) {
+    if (button.form) {
+        button.form.requestSubmit(button);
+    }
+}
+
+// "Add" buttons on the all items, category, product and search pages.
+async function addToCart(button) {
+    try {
+        const cart = await sendCartRequest("POST", "/api/cart/items", {product_id: Number(button.value)});
+        updateCartLink(cart.size);
+    } catch (error) {
+        submitForm(button);
+    }
+}
+
+// "Update" buttons on the cart page.
+async function updateCartQuantity(button) {
+    const productId = button.value;
+    const quantityInput = document.querySelector(`input[name="${productId}_quantity"]`);
+    const quantity = Number(quantityInput.value);
+    if (!Number.isInteger(quantity) || quantity < 0) {
+        return;
+    }
+    try {
+        const cart = await sendCartRequest("PATCH", `/api/cart/items/${productId}`, {quantity: quantity});
+        // An empty cart has its own page, so reload to show it.
+        if (cart.size === 0) {
+            window.location.reload();
+            return;
+        }
+        updateCartLink(cart.size);
+        document.getElementById("cart-total-price").textContent = formatPrice(cart.total_price);
+        document.querySelectorAll(`[data-cart-line="${productId}"]`).forEach((line) => {
+            if (cart.quantity === 0) {
+                line.remove();
+                return;
+            }
+            line.querySelectorAll(".cart-line-quantity").forEach((cell) => cell.textContent = cart.quantity);
+            line.querySelectorAll(".cart-line-total").forEach((cell) => cell.textContent = formatPrice(cart.line_total));
+        });
+    } catch (error) {
+        submitForm(button);
+    }
+}
+
+document.addEventListener("click", (event) => {
+    const button = event.target.closest("button[name='add_button'], button[name='update_button']");
+    if (!button || !window.fetch) {
+        return;
+    }
+    event.preventDefault();
+    if (button.name === "add_button") {
+        queueCartRequest(() => addToCart(button));
+    } else {
+        queueCartRequest(() => updateCartQuantity(button));
+    }
+});
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.local import LocalProxy
+from models import User
+
+# flask_login loads the logged in user on every request (see load_user in main.py). Instead of querying the users table
+# each time, each worker keeps the user's details for USER_CACHE_TTL seconds.
+# A cached user is rebuilt as a User that isn't attached to any database session, so it can be read (current_user.id,
+# current_user.name, ...) but changes to it are never saved. Routes that change a user query it from the database.
+# A user's cache entry is dropped as soon as a change to that user is committed from this worker, and other workers
+# pick the change up within USER_CACHE_TTL seconds.
+USER_CACHE_TTL = 30
+USER_CACHE_MAX_USERS = 10000
+USER_FIELDS = ["id", "name", "email", "password"]
+
+
+class UserCache:
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_users=USER_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None and cached[0] > time.monotonic():
+                self._users.move_to_end(user_id)
+                return User(**cached[1])
+        user = User.query.get(user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        with self._lock:
+            self._users[user_id] = (time.monotonic() + self.ttl, {field: getattr(user, field) for field in USER_FIELDS})
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+# Like the product catalog (see catalog.py), every app has its own user cache, made by create_app, and user_cache is the
+# cache of the current app.
+def init_user_cache(app, ttl=USER_CACHE_TTL, max_users=USER_CACHE_MAX_USERS):
+    cache = app.extensions["user_cache"] = UserCache(ttl, max_users)
+    return cache
+
+
+user_cache = LocalProxy(lambda: current_app.extensions["user_cache"])
+
+
+# Same as the product catalog (see catalog.py): users changed by a flush are remembered on the session, and dropped from
+# the cache once the session commits.
+@event.listens_for(Session, "after_flush")
+def _track_user_changes(session, flush_context):
+    user_ids = {instance.id for instance in (*session.dirty, *session.deleted) if isinstance(instance, User)}
+    if user_ids:
+        session.info.setdefault("changed_user_ids", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_users(session):
+    user_ids = session.info.pop("changed_user_ids", ())
+    cache = current_app.extensions.get("user_cache") if has_app_context() else None
+    if cache is not None:
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    session.info.pop("changed_user_ids", None)